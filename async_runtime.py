@@ -0,0 +1,303 @@
+import json
+import time
+import signal
+import asyncio
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import hive_rpc
+import block_store
+import outbox
+import reply_queue
+import metrics
+import db
+import resumption
+from listener import batch_sizer, comments_in_blocks, load_blacklist, update_head, seconds_until_next_block
+from reply import handle_new_comment, flush_writes, discard_writes
+from reminder_handler import process_reminders, next_due_time
+from hive_client import log_client_stats
+
+IO_THREADS = 8  # Blocking calls (pymongo writes, beem broadcasts) that may run at once
+FETCH_CONCURRENCY = 4  # Block range requests in flight while catching up
+MAX_IDLE = 30  # Longest a task sleeps without checking for work (seconds)
+ERROR_BACKOFF = 5  # First wait after an error, doubled up to MAX_IDLE
+SHUTDOWN_TIMEOUT = 20  # Seconds queued replies get to be posted on shutdown
+
+class AsyncRpc:
+    """Non-blocking JSON-RPC client that shares hive_rpc's node health and failover.
+
+    Uses aiohttp when it is installed; otherwise each call runs hive_rpc.call on
+    the runtime's thread pool.
+    """
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.session = None
+        try:
+            import aiohttp
+        except ImportError:
+            print("aiohttp is not installed; RPC calls run on worker threads instead.")
+            return
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=hive_rpc.REQUEST_TIMEOUT))
+
+    async def call(self, method, params, accept=None, retries=10, offset=0):
+        """Async counterpart of hive_rpc.call. Returns (result, url, response size in bytes)."""
+        if self.session is None:
+            def blocking_call():
+                result, url = hive_rpc.call(method, params, accept=accept, retries=retries, offset=offset)
+                return result, url, hive_rpc.last_response_size()
+            return await self.runtime.run_blocking(blocking_call)
+
+        data = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
+        while retries > 0:
+            node = hive_rpc.ranked_nodes(offset)[0]
+            wait = node.open_until - time.monotonic()
+            if wait > 0:
+                # Every circuit is open; back off until the first one may be retried
+                print(f"All Hive API nodes are unavailable. Retrying {node.url} in {wait:.1f} seconds...")
+                await asyncio.sleep(wait)
+
+            started = time.monotonic()
+            try:
+                async with self.session.post(node.url, json=data) as raw:
+                    body = await raw.read()
+                response = await self.runtime.run_blocking(_parse_json, body)
+                result = response.get('result')
+                if result is not None and (accept is None or accept(result)):
+                    hive_rpc.record_success(node, time.monotonic() - started)
+                    metrics.observe('rpc_latency_seconds', time.monotonic() - started, method=method, node=node.url)
+                    return result, node.url, len(body)
+                print(f"Unusable response for {method} from {node.url}: {response.get('error', 'empty result')}. Retrying...")
+            except Exception as e:
+                print(f"Exception while calling {method} on {node.url}: {e}")
+            hive_rpc.record_failure(node)
+            metrics.increment('rpc_errors_total', method=method, node=node.url)
+            retries -= 1
+
+        print("Max retries exceeded. Aborting.")
+        raise Exception(f"Failed to call {method} after multiple retries.")
+
+    async def close(self):
+        """Close the HTTP session."""
+        if self.session is not None:
+            await self.session.close()
+
+def _parse_json(body):
+    """Decode a JSON-RPC response body; large block ranges are parsed off the event loop."""
+    return json.loads(body)
+
+class BlockCursor:
+    """The block cursor in MongoDB, read and written through motor when it is installed."""
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.collection = None
+        try:
+            from motor.motor_asyncio import AsyncIOMotorClient
+        except ImportError:
+            print("motor is not installed; the block cursor is saved from worker threads instead.")
+            return
+        self.client = AsyncIOMotorClient(db.MONGO_URI, maxPoolSize=db.MAX_POOL_SIZE)
+        self.collection = self.client[db.DATABASE_NAME]['blocks']
+
+    async def load(self):
+        """Return the next block to process, or None if none was saved."""
+        if self.collection is None:
+            return await self.runtime.run_blocking(resumption.load_last_block)
+        doc = await self.collection.find_one({'_id': 'last_block'}, {'block_num': 1})
+        return doc.get('block_num') if doc else None
+
+    async def save(self, block_num):
+        """Record block_num as the next block to process."""
+        if self.collection is None:
+            return await self.runtime.run_blocking(resumption.save_last_block, block_num)
+        await self.collection.update_one({'_id': 'last_block'}, {'$set': {'block_num': block_num}}, upsert=True)
+
+    def close(self):
+        """Close the motor client."""
+        if self.collection is not None:
+            self.client.close()
+
+class AsyncRuntime:
+    """Block following, reminder firing and reply posting as cooperating asyncio tasks.
+
+    Network calls to the API nodes and the block cursor are non-blocking; the
+    synchronous comment handlers, pymongo writes and beem broadcasts run on a
+    bounded thread pool so a slow call never stalls the other tasks.
+    """
+
+    def __init__(self, once=False, follow_blocks=True):
+        self.once = once
+        self.follow = follow_blocks
+        self.shutdown_timeout = reply_queue.DRAIN_TIMEOUT if once else SHUTDOWN_TIMEOUT
+        self.executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix='async-io')
+        self.stop_event = asyncio.Event()
+        self.reminders_changed = asyncio.Event()  # Set when new reminders may be due sooner
+        self.caught_up = asyncio.Event()
+        if once and not follow_blocks:
+            self.caught_up.set()  # Another instance follows the chain; fire what is due and stop
+        self.rpc = AsyncRpc(self)
+        self.cursor = BlockCursor(self)
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking call on the thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def wait(self, timeout, *events):
+        """Sleep up to timeout seconds, returning early when stopping or one of events is set."""
+        waiters = [asyncio.ensure_future(event.wait()) for event in (self.stop_event,) + events]
+        try:
+            await asyncio.wait(waiters, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def get_head(self):
+        """Fetch and remember the head block number."""
+        result, _, _ = await self.rpc.call("condenser_api.get_dynamic_global_properties", [])
+        return update_head(result)
+
+    async def fetch_range(self, start_block, end_block, offset):
+        """Fetch one block range, through the block store when it is enabled.
+
+        The block store reads and writes files, so it is used from the thread pool.
+        """
+        blocks = await self.run_blocking(block_store.get_blocks, start_block, end_block)
+        if blocks is not None:
+            return blocks
+        count = end_block - start_block + 1
+        started = time.monotonic()
+        result, node, size = await self.rpc.call(
+            "block_api.get_block_range", {"starting_block_num": start_block, "count": count},
+            accept=lambda result: len(result.get('blocks') or []) == count, offset=offset
+        )
+        batch_sizer.record_fetch(count, time.monotonic() - started, size)
+        print(f"Fetched block range {start_block} to {end_block} from {node}")
+        await self.run_blocking(block_store.put_blocks, start_block, result['blocks'])
+        return result['blocks']
+
+    async def fetch_blocks(self, start_block, end_block):
+        """Fetch a batch of blocks as up to FETCH_CONCURRENCY concurrent range requests, in order."""
+        chunk = max((end_block - start_block + FETCH_CONCURRENCY) // FETCH_CONCURRENCY, 1)
+        ranges = [(start, min(start + chunk - 1, end_block)) for start in range(start_block, end_block + 1, chunk)]
+        results = await asyncio.gather(*(self.fetch_range(start, end, offset) for offset, (start, end) in enumerate(ranges)))
+        return [block for blocks in results for block in blocks]
+
+    def handle_batch(self, blocks):
+        """Handle the comments of a fetched batch and write their work; runs on the thread pool."""
+        for comment in comments_in_blocks(blocks, load_blacklist()):
+            handle_new_comment(comment)
+        flush_writes()
+
+    async def follow_blocks(self):
+        """Process blocks up to the head, then one block at a time as they are produced."""
+        head = await self.get_head()
+        next_block = min(await self.cursor.load() or head, head)
+        error_backoff = ERROR_BACKOFF
+        while not self.stop_event.is_set():
+            try:
+                if next_block <= head:
+                    lag = head - next_block + 1
+                    end_block = next_block + batch_sizer.next_size(lag) - 1
+                    metrics.set_gauge('block_lag', lag)
+                    metrics.set_gauge('block_batch_size', end_block - next_block + 1)
+                    blocks = await self.fetch_blocks(next_block, end_block)
+                    await self.run_blocking(self.handle_batch, blocks)
+                    await self.cursor.save(end_block + 1)
+                    metrics.increment('blocks_processed_total', end_block - next_block + 1)
+                    next_block = end_block + 1
+                    self.reminders_changed.set()
+                if next_block > head:
+                    if self.once:
+                        self.caught_up.set()
+                        return
+                    await self.wait(seconds_until_next_block())
+                head = await self.get_head()
+                error_backoff = ERROR_BACKOFF
+            except Exception as e:
+                print(f"An error occurred while following blocks: {e}")
+                await self.run_blocking(discard_writes)
+                if self.once:
+                    raise
+                print(f"Retrying in {error_backoff} seconds...")
+                await self.wait(error_backoff)
+                error_backoff = min(error_backoff * 2, MAX_IDLE)
+
+    async def fire_reminders(self):
+        """Queue reminder replies as they fall due."""
+        while not self.stop_event.is_set():
+            self.reminders_changed.clear()
+            try:
+                await self.run_blocking(process_reminders)
+            except Exception as e:
+                print(f"An error occurred while processing reminders: {e}")
+            if self.once and self.caught_up.is_set():
+                return
+            due = next_due_time()
+            wait = MAX_IDLE if due is None else min((due - datetime.utcnow()).total_seconds(), MAX_IDLE)
+            await self.wait(wait, self.reminders_changed, self.caught_up)
+
+    async def post_replies(self):
+        """Drain the outbox until stopping, then give queued replies shutdown_timeout seconds."""
+        deadline = None
+        while True:
+            if self.stop_event.is_set() and deadline is None:
+                deadline = time.monotonic() + self.shutdown_timeout
+            try:
+                delay = await self.run_blocking(outbox.drain_once)
+            except Exception as e:
+                print(f"Posting error: {e}")
+                delay = None
+            if deadline is not None:
+                pending = await self.run_blocking(outbox.has_pending)
+                if not pending or time.monotonic() >= deadline:
+                    if pending:
+                        print("Stopping with replies still queued.")
+                    return
+            wait = outbox.POLL_INTERVAL if delay is None else min(delay, outbox.POLL_INTERVAL)
+            if deadline is None:
+                await self.wait(wait)
+            else:
+                await asyncio.sleep(wait)
+
+    def request_stop(self):
+        """Ask every task to finish its current work and stop."""
+        if not self.stop_event.is_set():
+            print("Shutdown requested. Finishing the current batch...")
+            self.stop_event.set()
+
+    async def main(self):
+        """Run the tasks until stopped, or until caught up in once mode, then shut down."""
+        loop = asyncio.get_running_loop()
+        if not self.once:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.add_signal_handler(signum, self.request_stop)
+                except NotImplementedError:
+                    # Windows event loops have no signal handlers
+                    signal.signal(signum, lambda signum, frame: loop.call_soon_threadsafe(self.request_stop))
+        metrics.start()
+        poster = asyncio.ensure_future(self.post_replies())
+        try:
+            tasks = [self.fire_reminders()]
+            if self.follow:
+                tasks.append(self.follow_blocks())
+            await asyncio.gather(*tasks)
+        finally:
+            self.stop_event.set()
+            await poster
+            await self.rpc.close()
+            self.cursor.close()
+            self.executor.shutdown()
+            log_client_stats()
+            metrics.stop()
+            block_store.close()
+            db.close()
+
+async def run_async(once=False, follow_blocks=True):
+    """Create the runtime inside the event loop and run it."""
+    await AsyncRuntime(once=once, follow_blocks=follow_blocks).main()
+
+def run(once=False, follow_blocks=True):
+    """Synchronous entry point: run the bot on an asyncio event loop until it stops."""
+    asyncio.run(run_async(once, follow_blocks))
@@ -0,0 +1,57 @@
+import threading
+
+MAX_BATCH_BLOCKS = 1000  # Node limit for block_api.get_block_range
+INITIAL_BATCH_BLOCKS = 50  # Batch size used until the first fetch has been measured
+TARGET_FETCH_SECONDS = 5  # Aim for requests well inside hive_rpc.REQUEST_TIMEOUT
+MAX_RESPONSE_BYTES = 16 * 1024 * 1024  # Keep single responses small enough to parse comfortably
+MIN_SAMPLE_BLOCKS = 10  # Smaller fetches mostly measure round-trip overhead and are not sampled
+SAMPLE_WEIGHT = 0.3  # Weight of the newest fetch in the moving averages
+MAX_GROWTH = 2  # The allowed batch size at most doubles from one batch to the next
+
+class BatchSizer:
+    """Choose how many blocks to process per batch.
+
+    Far behind the head, batches grow towards the node limit, bounded by how long
+    and how large recent block range responses were per block. At the head the
+    batch is exactly the lag, which is usually the single block just produced.
+    """
+
+    def __init__(self, max_size=MAX_BATCH_BLOCKS, initial_size=INITIAL_BATCH_BLOCKS):
+        self.max_size = max_size
+        self.allowance = initial_size  # Largest batch currently allowed, regardless of lag
+        self.size = initial_size  # Size of the last batch handed out
+        self.lag = None  # Blocks between the cursor and the head when the last batch was sized
+        self.seconds_per_block = None  # Moving average over fetched ranges
+        self.bytes_per_block = None
+        self._lock = threading.Lock()
+
+    def record_fetch(self, blocks, seconds, size_bytes):
+        """Fold one block range request into the per-block latency and size averages."""
+        if blocks < MIN_SAMPLE_BLOCKS:
+            return
+        with self._lock:
+            if self.seconds_per_block is None:
+                self.seconds_per_block = seconds / blocks
+                self.bytes_per_block = size_bytes / blocks
+            else:
+                self.seconds_per_block += SAMPLE_WEIGHT * (seconds / blocks - self.seconds_per_block)
+                self.bytes_per_block += SAMPLE_WEIGHT * (size_bytes / blocks - self.bytes_per_block)
+
+    def target_size(self):
+        """Largest batch the recent latency and response size allow."""
+        with self._lock:
+            if self.seconds_per_block is None:
+                return self.allowance
+            limit = self.max_size
+            if self.seconds_per_block > 0:
+                limit = min(limit, TARGET_FETCH_SECONDS / self.seconds_per_block)
+            if self.bytes_per_block > 0:
+                limit = min(limit, MAX_RESPONSE_BYTES / self.bytes_per_block)
+            return max(int(limit), 1)
+
+    def next_size(self, lag):
+        """Return the number of blocks to process next when the cursor is lag blocks behind the head."""
+        self.allowance = min(self.target_size(), self.allowance * MAX_GROWTH, self.max_size)
+        self.size = max(min(self.allowance, lag), 1)
+        self.lag = lag
+        return self.size
@@ -0,0 +1,99 @@
+"""Operations/s and allocations per block of listener.comments_in_blocks.
+
+Compares the pre-filter with the original stage, which built a comment dict for
+every reply and then lowercased its body to look for the command:
+
+    python bench/comment_filter.py [--count 2000] [--blocks recorded.json]
+"""
+import io
+import time
+import contextlib
+import argparse
+import tracemalloc
+
+from common import blocks_from_args
+from listener import comments_in_blocks
+
+BLACKLIST = {f"user{number}" for number in range(0, 5000, 50)}
+
+def original_filter(blocks, blacklist):
+    """The original listener stage followed by the original command check in handle_new_comment."""
+    for block in blocks:
+        block_timestamp = block['timestamp']
+        for transaction in block['transactions']:
+            for operation in transaction['operations']:
+                if operation['type'] == 'comment_operation':
+                    comment_data = operation['value']
+                    if comment_data['parent_author'] != '':
+                        comment = {
+                            'author': comment_data['author'],
+                            'permlink': comment_data['permlink'],
+                            'parent_author': comment_data['parent_author'],
+                            'parent_permlink': comment_data['parent_permlink'],
+                            'body': comment_data['body'],
+                            'metadata': comment_data["json_metadata"],
+                            'block_timestamp': block_timestamp
+                        }
+                        if comment['author'] not in blacklist and '!remindme' in comment['body'].lower():
+                            yield comment
+
+def ops_per_second(stage, blocks, operations):
+    """Run the stage over all blocks, best of three; return operations/s and the commands found."""
+    best, found = None, None
+    for _ in range(3):
+        started = time.perf_counter()
+        found = sum(1 for _ in stage(blocks, BLACKLIST))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return operations / best, found
+
+def peak_allocation(stage, block):
+    """Return the most memory allocated at once while filtering block, as traced by tracemalloc."""
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in stage([block], BLACKLIST):
+        pass
+    return tracemalloc.get_traced_memory()[1] - before
+
+def bytes_per_block(stage, blocks):
+    """Return the mean peak allocation per block, less what filtering an empty block takes.
+
+    Temporaries such as a dict or a lowercased body are freed before the next
+    operation, so the peak is the largest of them rather than their sum.
+    """
+    empty = {'block_id': blocks[0]['block_id'], 'timestamp': blocks[0]['timestamp'], 'transactions': []}
+    tracemalloc.start()
+    overhead = min(peak_allocation(stage, empty) for _ in range(3))
+    total = sum(peak_allocation(stage, block) for block in blocks)
+    tracemalloc.stop()
+    return total / len(blocks) - overhead
+
+def dicts_per_block(stage, blocks):
+    """Return how many comment dicts the stage builds per block."""
+    if stage is original_filter:
+        # One per reply, whether or not it turns out to be a command
+        return sum(
+            1 for block in blocks for transaction in block['transactions'] for operation in transaction['operations']
+            if operation['type'] == 'comment_operation' and operation['value']['parent_author']
+        ) / len(blocks)
+    return sum(1 for _ in stage(blocks, BLACKLIST)) / len(blocks)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000, help="generated blocks to filter")
+    parser.add_argument('--blocks', help="JSON file of recorded blocks to filter instead")
+    args = parser.parse_args()
+
+    blocks = blocks_from_args(args)
+    operations = sum(len(transaction['operations']) for block in blocks for transaction in block['transactions'])
+    print(f"{len(blocks)} blocks, {operations} operations")
+    for name, stage in (('original', original_filter), ('pre-filter', comments_in_blocks)):
+        with contextlib.redirect_stdout(io.StringIO()):  # Blacklisted authors are logged
+            rate, found = ops_per_second(stage, blocks, operations)
+            allocated = bytes_per_block(stage, blocks)
+            built = dicts_per_block(stage, blocks)
+        print(f"{name:>10}: {rate:,.0f} ops/s, {found} commands, {built:.2f} comment dicts "
+              f"and a peak of {allocated:,.0f} bytes allocated per block")
+
+if __name__ == '__main__':
+    main()
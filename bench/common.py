@@ -0,0 +1,89 @@
+"""Shared helpers for the benchmarks in this directory.
+
+The benchmarks run the bot's modules directly, so they put the repository root
+on sys.path. Blocks are generated to resemble busy mainnet blocks unless a file
+of recorded blocks is given.
+"""
+import os
+import sys
+import json
+import time
+import random
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIRST_BLOCK = 80000000
+OPS_PER_BLOCK = 60  # A busy block: mostly votes and custom_json, with some comments
+COMMENT_SHARE = 0.2  # Share of operations that are comments
+COMMAND_SHARE = 0.02  # Share of comments that contain !remindme
+UNITS = ['minutes', 'hours', 'days', 'weeks', 'months']
+
+def make_command(rng):
+    """Return a !remindme line; amounts vary so parse results are not all cached."""
+    amount = rng.randrange(1, 500)
+    return rng.choice([
+        f"!remindme {amount} {rng.choice(UNITS)}",
+        f"!RemindMe in {amount} {rng.choice(UNITS)}",
+        f"!remindme {amount} days and {rng.randrange(1, 24)} hours",
+        f"!remindme next {rng.choice(['monday', 'friday', 'week'])} at {rng.randrange(24)}:{rng.randrange(60):02d}",
+    ])
+
+def make_block(block_num, rng, command_share=COMMAND_SHARE):
+    """Return a block_api.get_block_range style block with OPS_PER_BLOCK generated operations."""
+    timestamp = datetime(2024, 1, 1) + timedelta(seconds=3 * (block_num - FIRST_BLOCK))
+    transactions = []
+    for number in range(OPS_PER_BLOCK):
+        author = f"user{rng.randrange(5000)}"
+        if rng.random() < COMMENT_SHARE:
+            body = "Nice post! " * rng.randrange(1, 200)  # About 1 KB on average
+            if rng.random() < command_share:
+                body += make_command(rng)
+            operation = {'type': 'comment_operation', 'value': {
+                'parent_author': f"user{rng.randrange(5000)}", 'parent_permlink': f"post-{number}",
+                'author': author, 'permlink': f"re-{block_num}-{number}", 'title': "",
+                'body': body, 'json_metadata': '{"app":"peakd/2024.1.1"}'
+            }}
+        elif rng.random() < 0.5:
+            operation = {'type': 'vote_operation', 'value': {
+                'voter': author, 'author': f"user{rng.randrange(5000)}", 'permlink': f"post-{number}", 'weight': 10000
+            }}
+        else:
+            operation = {'type': 'custom_json_operation', 'value': {
+                'required_auths': [], 'required_posting_auths': [author], 'id': 'sm_find_match',
+                'json': '{"match_type":"Ranked"}'
+            }}
+        transactions.append({'ref_block_num': block_num & 0xffff, 'operations': [operation]})
+    return {
+        'block_id': f"{block_num:08x}" + "0" * 32,
+        'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S'),
+        'transactions': transactions
+    }
+
+def make_blocks(count, first_block=FIRST_BLOCK, seed=1, command_share=COMMAND_SHARE):
+    """Generate count consecutive blocks, the same ones for the same seed."""
+    rng = random.Random(seed)
+    return [make_block(first_block + number, rng, command_share) for number in range(count)]
+
+def load_blocks(path):
+    """Read recorded blocks: a JSON list as returned by block_api.get_block_range."""
+    with open(path) as f:
+        blocks = json.load(f)
+    return blocks['blocks'] if isinstance(blocks, dict) else blocks
+
+def blocks_from_args(args, command_share=COMMAND_SHARE):
+    """Return the recorded blocks given with --blocks, or generated ones."""
+    if args.blocks:
+        return load_blocks(args.blocks)
+    return make_blocks(args.count, command_share=command_share)
+
+def timed(func, *args, repeat=3):
+    """Return the fastest of repeat runs of func(*args) in seconds, and its result."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,96 @@
+"""Startup cost of the shared lazy MongoClient against the original four clients.
+
+The original listener, reply, reminder_handler and resumption modules each
+created a MongoClient when imported. Each scenario runs in a fresh interpreter
+and reports the time and memory its clients take and the threads they start:
+
+    python bench/db_clients.py [--uri mongodb://localhost:27017] [--ping]
+
+Without --ping no server is needed; the clients are created but not used.
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import tracemalloc
+
+from common import ROOT
+
+BOT_MODULES = ['listener', 'reply', 'reminder_handler', 'resumption']
+SETTLE_SECONDS = 1  # Time for the clients' background threads to start
+
+def four_clients(uri, ping):
+    """What importing the original modules did: one default client per module."""
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    clients = []
+    for _ in BOT_MODULES:
+        load_dotenv()
+        clients.append(MongoClient(uri))
+    if ping:
+        for client in clients:
+            client.admin.command('ping')
+    return clients
+
+def shared_client(uri, ping):
+    """Importing the modules creates no client; the first query creates the shared one."""
+    import db
+    assert db._client is None, "importing the bot modules created a client"
+    db.MONGO_URI = uri
+    client = db.get_client()
+    if ping:
+        client.admin.command('ping')
+    return [client]
+
+SCENARIOS = {'four clients': four_clients, 'shared lazy client': shared_client}
+
+def rss_kib():
+    """Return the resident set size of this process in KiB (Linux)."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def run_scenario(name, uri, ping):
+    """Measure one scenario in this interpreter and print the results as JSON."""
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    for module in BOT_MODULES:
+        __import__(module)
+    imported = time.perf_counter() - started
+    threads, rss = threading.active_count(), rss_kib()
+    tracemalloc.start()
+    started = time.perf_counter()
+    clients = SCENARIOS[name](uri, ping)
+    elapsed = time.perf_counter() - started
+    time.sleep(SETTLE_SECONDS)
+    traced, _ = tracemalloc.get_traced_memory()
+    print(json.dumps({
+        'import_seconds': imported, 'client_seconds': elapsed, 'clients': len(clients),
+        'threads': threading.active_count() - threads, 'traced_kib': traced / 1024, 'rss_kib': rss_kib() - rss
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default='mongodb://127.0.0.1:27017', help="server the clients are created for")
+    parser.add_argument('--ping', action='store_true', help="also send each client's first command")
+    parser.add_argument('--scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scenario:
+        run_scenario(args.scenario, args.uri, args.ping)
+        return
+
+    print(f"Importing {', '.join(BOT_MODULES)}, then creating their MongoDB clients")
+    for name in SCENARIOS:
+        command = [sys.executable, __file__, '--scenario', name, '--uri', args.uri] + (['--ping'] if args.ping else [])
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:>18}: {result['clients']} client(s) in {result['client_seconds'] * 1000:.1f} ms, "
+              f"{result['threads']} threads, {result['traced_kib']:,.0f} KiB traced, "
+              f"{result['rss_kib']:,} KiB RSS (module imports took {result['import_seconds'] * 1000:.0f} ms)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Reply rendering with templates.render() against the original eval(f"f'''...'''") path.
+
+    python bench/render.py [--number 20000]
+"""
+import argparse
+import timeit
+from datetime import datetime
+
+import common  # Puts the repository root on sys.path
+from templates import render
+from reminder_handler import time_ago, DEFAULT_REMIND_NOTIFICATION
+
+# Reply texts like the ones in the reply_text collection
+TEMPLATES = {
+    'reminder': DEFAULT_REMIND_NOTIFICATION + "\n\n----\nYou asked me {time_ago(block_timestamp)} to remind you.",
+    'confirmation': ("Hey @{author}, I'll remind you in {time_string} on {target_timestamp:%Y-%m-%d %H:%M} UTC.\n\n"
+                     "----\nReply `!remindme <time>` to any comment and @{HIVE_USER} will ping you."),
+}
+CONTEXT = {
+    'comment': {'author': 'alice', 'permlink': 're-post', 'body': '!remindme 2 days'},
+    'author': 'alice',
+    'time_string': '2 days',
+    'block_timestamp': '2024-01-01T00:00:00',
+    'target_timestamp': datetime(2024, 1, 3),
+    'HIVE_USER': 'reminder.bot',
+    'time_ago': time_ago,
+}
+
+def render_with_eval(text, context):
+    """The original path: evaluate the text as an f-string in the handler's scope."""
+    return eval(f"f'''{text}'''", {}, dict(context))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help="renders per measurement")
+    args = parser.parse_args()
+
+    for name, text in TEMPLATES.items():
+        assert render(text, CONTEXT) == render_with_eval(text, CONTEXT), name
+        print(f"{name} template:")
+        for label, function in (('eval f-string', render_with_eval), ('render', render)):
+            seconds = min(timeit.repeat(lambda: function(text, CONTEXT), number=args.number, repeat=3))
+            print(f"  {label:>13}: {args.number / seconds:,.0f} renders/s ({seconds / args.number * 1e6:.1f} us each)")
+
+if __name__ == '__main__':
+    main()
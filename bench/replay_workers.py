@@ -0,0 +1,67 @@
+"""Replay throughput of main.replay() against the number of comment workers.
+
+Blocks are written to a temporary block store and replayed in dry-run mode once
+per worker count, as `python main.py --replay <start> <end> --workers <n>` would:
+
+    python bench/replay_workers.py [--count 2000] [--command-share 0.3] [--workers 1 2 4 8]
+
+Replay reads the blacklist and reply templates from MongoDB. Without --uri an
+in-memory mongomock database (from requirements-dev.txt) stands in for it.
+"""
+import io
+import time
+import argparse
+import tempfile
+import contextlib
+
+from common import blocks_from_args
+import db
+import main as bot
+import listener
+import block_store
+from batch_sizer import BatchSizer
+
+def use_database(uri):
+    """Point the shared client at uri, or at a fresh in-memory database with a confirmation template."""
+    if uri:
+        db.MONGO_URI = uri
+        return
+    import mongomock
+    db._client = mongomock.MongoClient()
+    db.reply_text().insert_one({'type': 'confirm_listing', 'text': "Noted, @{author}! See you in {time_string}."})
+
+def replay(first_block, last_block, workers, uri):
+    """Replay the stored blocks with workers comment workers; return the seconds taken."""
+    use_database(uri)
+    # Every run starts from the smallest batch, as a fresh replay does
+    bot.batch_sizer = listener.batch_sizer = BatchSizer(max_size=listener.MAX_BLOCKS_PER_REQUEST)
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        bot.replay(first_block, last_block, worker_count=workers)
+        return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000, help="generated blocks to replay")
+    parser.add_argument('--blocks', help="JSON file of recorded blocks to replay instead")
+    parser.add_argument('--command-share', type=float, default=0.3, help="share of generated comments with a command")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="worker counts to measure")
+    parser.add_argument('--uri', help="MongoDB server to read the blacklist and templates from")
+    args = parser.parse_args()
+
+    blocks = blocks_from_args(args, command_share=args.command_share)
+    first_block = int(blocks[0]['block_id'][:8], 16)
+    last_block = first_block + len(blocks) - 1
+    commands = sum(1 for _ in listener.comments_in_blocks(blocks, set()))
+    with tempfile.TemporaryDirectory() as directory:
+        block_store.BLOCK_STORE_DIR = directory
+        block_store.put_blocks(first_block, blocks)
+        block_store.close()
+        print(f"Replaying {len(blocks)} blocks holding {commands} commands")
+        for workers in args.workers:
+            seconds = replay(first_block, last_block, workers, args.uri)
+            print(f"--workers {workers}: {len(blocks) / seconds:,.0f} blocks/s, {commands / seconds:,.0f} commands/s "
+                  f"({seconds:.2f} s, including starting the workers)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Cold-start import time of main.py, measured with python -X importtime.
+
+Reports the median time to import main over several fresh interpreters and the
+slowest imports of the last run. The lazily imported beem and dateutil are timed
+as well, to show what a run that never posts or falls back to dateutil saves:
+
+    python bench/startup.py [--runs 5]
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+
+from common import ROOT
+
+LAZY_MODULES = ['beem.transactionbuilder', 'dateutil.parser']
+
+def import_times(statement):
+    """Run statement in a fresh interpreter with -X importtime; return {module: cumulative microseconds}."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+def median_import(module, runs):
+    """Return the median cumulative import time of module in seconds, and the times of the last run."""
+    samples, times = [], {}
+    for _ in range(runs):
+        times = import_times(f'import {module}')
+        samples.append(times[module] / 1e6)
+    return statistics.median(samples), times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument('--top', type=int, default=10, help="slowest packages to list")
+    args = parser.parse_args()
+
+    seconds, times = median_import('main', args.runs)
+    print(f"import main: {seconds * 1000:.0f} ms (median of {args.runs}); slowest packages, including what they import:")
+    for module in sorted((m for m in times if '.' not in m and m != 'main'), key=times.get, reverse=True)[:args.top]:
+        print(f"  {module:<20} {times[module] / 1000:8.1f} ms")
+    for module in LAZY_MODULES:
+        seconds, _ = median_import(module, args.runs)
+        print(f"deferred {module}: {seconds * 1000:.0f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Catch-up throughput of listener.stream_blocks against a local mock JSON-RPC node.
+
+The mock serves block_api.get_block_range from generated (or recorded) blocks
+with an optional per-request latency, so the prefetch pipeline can be measured
+without a public node:
+
+    python bench/stream_blocks.py --count 20000 --latency 150
+"""
+import io
+import json
+import time
+import argparse
+import multiprocessing
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import blocks_from_args, timed
+import hive_rpc
+import listener
+from batch_sizer import BatchSizer
+
+class MockNode(BaseHTTPRequestHandler):
+    """Answers the two JSON-RPC methods the listener uses from pre-serialized blocks."""
+
+    blocks = []  # JSON text of each block, in order
+    first_block = 0
+    latency = 0.0
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.latency)
+        last_block = self.first_block + len(self.blocks) - 1
+        if request['method'] == 'block_api.get_block_range':
+            start = request['params']['starting_block_num'] - self.first_block
+            selected = self.blocks[start:start + request['params']['count']]
+            result = '{"blocks":[' + ','.join(selected) + ']}'
+        else:
+            result = json.dumps({'head_block_number': last_block, 'time': '2024-01-01T00:00:00'})
+        body = ('{"jsonrpc":"2.0","id":1,"result":' + result + '}').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(blocks, latency, ports):
+    """Run the mock node; the port it listens on is put on ports."""
+    MockNode.blocks = [json.dumps(block) for block in blocks]
+    MockNode.first_block = int(blocks[0]['block_id'][:8], 16)
+    MockNode.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockNode)
+    server.daemon_threads = True
+    ports.put(server.server_port)
+    server.serve_forever()
+
+def start_node(blocks, latency):
+    """Serve blocks from another process, so the node does not compete for the GIL, and point hive_rpc at it."""
+    context = multiprocessing.get_context('spawn')
+    ports = context.Queue()
+    process = context.Process(target=serve, args=(blocks, latency, ports), daemon=True)
+    process.start()
+    url = f"http://127.0.0.1:{ports.get()}"
+    hive_rpc.HIVE_API = [url]
+    hive_rpc._nodes = [hive_rpc.NodeHealth(url)]
+    return process
+
+def catch_up(first_block, last_block, prefetch_depth):
+    """Stream every block like the main loop does while behind the head; return the blocks seen."""
+    listener.PREFETCH_DEPTH = prefetch_depth
+    listener.batch_sizer = BatchSizer(max_size=listener.MAX_BLOCKS_PER_REQUEST)
+    listener._prefetched.clear()
+    listener.get_latest_block_num()
+    seen = 0
+    next_block = first_block
+    while next_block <= last_block:
+        end_block = next_block + listener.batch_sizer.next_size(last_block - next_block + 1) - 1
+        for _ in listener.stream_blocks(next_block, end_block):
+            seen += 1
+        next_block = end_block + 1
+    return seen
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000, help="generated blocks to serve")
+    parser.add_argument('--blocks', help="JSON file of recorded blocks to serve instead")
+    parser.add_argument('--latency', type=float, default=100, help="milliseconds added to every request")
+    args = parser.parse_args()
+
+    blocks = blocks_from_args(args)
+    node = start_node(blocks, args.latency / 1000)
+    first_block = int(blocks[0]['block_id'][:8], 16)
+    last_block = first_block + len(blocks) - 1
+    print(f"Serving {len(blocks)} blocks with {args.latency:.0f} ms latency per request")
+    # Decoding the responses alone bounds the rate when the node is fast
+    decode_seconds, _ = timed(json.loads, json.dumps({'blocks': blocks}), repeat=1)
+    print(f"JSON decoding alone: {len(blocks) / decode_seconds:,.0f} blocks/s")
+    for depth in (1, listener.PREFETCH_DEPTH):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            seen = catch_up(first_block, last_block, depth)
+            elapsed = time.perf_counter() - started
+        assert seen == len(blocks)
+        print(f"prefetch depth {depth}: {seen / elapsed:,.0f} blocks/s ({elapsed:.2f} s)")
+    node.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Parse rate and accuracy of the time-expression parser against the original one.
+
+The original parser is read from the baseline commit with git, so this must run
+from a clone of the repository. Accuracy is measured on the corpus of the parser
+tests; the original resolves relative expressions against the wall clock, so it
+gets those wrong whenever it runs:
+
+    python bench/time_parser.py [--baseline <commit>] [--show-differences]
+"""
+import io
+import os
+import re
+import ast
+import time
+import argparse
+import contextlib
+import subprocess
+from datetime import datetime, timedelta
+
+from common import ROOT
+import reply
+
+BASELINE = 'cba0253'  # Commit with the original reply.py
+BASELINE_FUNCTIONS = ('extract_time_string', 'calculate_target_timestamp')
+
+def load_baseline(commit):
+    """Return a parse(body, block_timestamp) built from the baseline's reply.py functions."""
+    source = subprocess.run(['git', 'show', f'{commit}:reply.py'], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    # Only the parsing functions are taken; the module itself connects to Hive and MongoDB on import
+    tree = ast.parse(source)
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in BASELINE_FUNCTIONS]
+    from dateutil import parser
+    namespace = {'re': re, 'datetime': datetime, 'timedelta': timedelta, 'parser': parser}
+    exec(compile(ast.Module(body=functions, type_ignores=[]), f'{commit}:reply.py', 'exec'), namespace)
+
+    def parse(body, block_timestamp):
+        time_string = namespace['extract_time_string'](body)
+        if not time_string:
+            return None, None
+        return time_string, namespace['calculate_target_timestamp'](block_timestamp, time_string)
+    return parse
+
+def load_corpus():
+    """Return (body, expected target) pairs from the parser tests; unparseable bodies expect None."""
+    import sys
+    sys.path.insert(0, os.path.join(ROOT, 'tests'))
+    from test_time_parser import CORPUS, UNPARSEABLE, BLOCK_TIMESTAMP
+    return [(body, expected) for body, expected in CORPUS] + [(body, None) for body in UNPARSEABLE], BLOCK_TIMESTAMP
+
+def parse_all(parse, corpus, block_timestamp):
+    """Parse every body; a parser error counts as the result 'error'."""
+    results = []
+    for body, _ in corpus:
+        try:
+            results.append(parse(body, block_timestamp)[1])
+        except Exception as e:
+            results.append(f'error: {type(e).__name__}')
+    return results
+
+def parse_rate(parse, corpus, block_timestamp, seconds, before_pass=None):
+    """Return the bodies parsed per second, parsing the corpus repeatedly for about seconds."""
+    parsed = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        if before_pass is not None:
+            before_pass()
+        parse_all(parse, corpus, block_timestamp)
+        parsed += len(corpus)
+    return parsed / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default=BASELINE, help="commit holding the original parser")
+    parser.add_argument('--seconds', type=float, default=3, help="time spent measuring each parser")
+    parser.add_argument('--show-differences', action='store_true', help="list the bodies the parsers disagree on")
+    args = parser.parse_args()
+
+    corpus, block_timestamp = load_corpus()
+    parsers = {
+        'baseline': (load_baseline(args.baseline), None),
+        # The cache would turn every pass after the first into dictionary lookups
+        'current': (reply.parse_comment, reply.calculate_target_timestamp.cache_clear),
+    }
+    results = {}
+    print(f"{len(corpus)} corpus bodies")
+    for name, (parse, before_pass) in parsers.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = parse_all(parse, corpus, block_timestamp)
+            rate = parse_rate(parse, corpus, block_timestamp, args.seconds, before_pass)
+        correct = sum(result == expected for result, (_, expected) in zip(results[name], corpus))
+        errors = sum(isinstance(result, str) for result in results[name])
+        print(f"{name:>8}: {rate:,.0f} parses/s, {correct}/{len(corpus)} correct ({correct / len(corpus):.0%}), {errors} raised")
+
+    differences = [(body, old, new) for (body, _), old, new in zip(corpus, results['baseline'], results['current']) if old != new]
+    print(f"The parsers disagree on {len(differences)} of {len(corpus)} bodies")
+    if args.show_differences:
+        for body, old, new in differences:
+            print(f"  {body[:60]!r}: baseline {old}, current {new}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+BLOCK_STORE_DIR = os.getenv('BLOCK_STORE_DIR')  # Directory for archived blocks; unset disables the store
+
+SEGMENT_BLOCKS = 100000  # Blocks per segment (one data file and one index file)
+COMPRESSION_LEVEL = 6  # zlib level used for each stored block
+INDEX_RECORD = struct.Struct('<IQI')  # Block number, offset in the data file, compressed length
+
+_segments = {}  # First block number -> Segment
+_lock = threading.Lock()
+
+class Segment:
+    """An append-only file of compressed blocks plus an index of where each block starts.
+
+    Blocks are written to the data file before their index record, so a crash
+    leaves at most unindexed bytes at the end of the data file, which are ignored.
+    """
+
+    def __init__(self, directory, first_block):
+        base = os.path.join(directory, f"blocks-{first_block:010d}")
+        self.data_path = base + '.dat'
+        self.index_path = base + '.idx'
+        self.offsets = {}  # Block number -> (offset, length)
+        self.map = None
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % INDEX_RECORD.size
+            if usable != len(raw):
+                os.truncate(self.index_path, usable)  # Drop a record cut short by a crash
+            for block_num, offset, length in INDEX_RECORD.iter_unpack(raw[:usable]):
+                self.offsets[block_num] = (offset, length)
+
+        self.data = open(self.data_path, 'ab')
+        self.index = open(self.index_path, 'ab')
+        self.reader = open(self.data_path, 'rb')
+
+    def read(self, block_num):
+        """Return the compressed bytes of a block, or None if it is not stored."""
+        entry = self.offsets.get(block_num)
+        if entry is None:
+            return None
+        offset, length = entry
+        if self.map is None or offset + length > len(self.map):
+            # The data file grew since it was mapped
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.reader.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length]
+
+    def write(self, block_num, block):
+        """Append a block and index it."""
+        payload = zlib.compress(json.dumps(block, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+        offset = self.data.seek(0, os.SEEK_END)
+        self.data.write(payload)
+        self.data.flush()
+        self.index.write(INDEX_RECORD.pack(block_num, offset, len(payload)))
+        self.index.flush()
+        self.offsets[block_num] = (offset, len(payload))
+
+    def close(self):
+        """Release the segment's files and memory map."""
+        if self.map is not None:
+            self.map.close()
+        self.data.close()
+        self.index.close()
+        self.reader.close()
+
+def enabled():
+    """Return whether a block store directory is configured."""
+    return BLOCK_STORE_DIR is not None
+
+def get_segment(block_num):
+    """Return the segment holding block_num, opening it on first use. Call with _lock held."""
+    first_block = block_num - block_num % SEGMENT_BLOCKS
+    segment = _segments.get(first_block)
+    if segment is None:
+        os.makedirs(BLOCK_STORE_DIR, exist_ok=True)
+        segment = Segment(BLOCK_STORE_DIR, first_block)
+        _segments[first_block] = segment
+    return segment
+
+def get_blocks(start_block, end_block):
+    """Return blocks start_block to end_block from the store, or None unless all of them are stored."""
+    if not enabled():
+        return None
+    with _lock:
+        payloads = []
+        for block_num in range(start_block, end_block + 1):
+            payload = get_segment(block_num).read(block_num)
+            if payload is None:
+                return None
+            payloads.append(payload)
+    return [json.loads(zlib.decompress(payload)) for payload in payloads]
+
+def put_blocks(start_block, blocks):
+    """Archive consecutive blocks starting at start_block, skipping ones already stored."""
+    if not enabled():
+        return
+    with _lock:
+        for block_num, block in enumerate(blocks, start_block):
+            segment = get_segment(block_num)
+            if block_num not in segment.offsets:
+                segment.write(block_num, block)
+
+def close():
+    """Close every open segment."""
+    with _lock:
+        for segment in _segments.values():
+            segment.close()
+        _segments.clear()
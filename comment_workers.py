@@ -0,0 +1,46 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from reply import handle_new_comment
+
+WINDOW_PER_WORKER = 4  # Comments in flight per worker before the oldest must finish
+
+class CommentWorkers:
+    """Handle comments concurrently while handing them back in block order.
+
+    Each comment is handled on a worker thread, which sends the CPU-bound
+    parsing to a process pool and does the database and outbox writes itself.
+    Comments are yielded strictly in the order they arrived, so a checkpoint
+    taken at a yielded comment never covers one that is still being handled.
+    """
+
+    def __init__(self, workers):
+        self.window_size = workers * WINDOW_PER_WORKER
+        self.threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='comment-worker')
+        # Forking once the MongoDB client and posting threads exist can copy a held lock
+        # into the child, so parsing processes start from a fresh interpreter instead
+        self.processes = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def handle(self, comments):
+        """Handle comments and yield each one, in order, once it has been handled."""
+        window = deque()
+        try:
+            for comment in comments:
+                window.append((comment, self.threads.submit(handle_new_comment, comment, self.processes)))
+                if len(window) >= self.window_size:
+                    comment, future = window.popleft()
+                    future.result()
+                    yield comment
+            while window:
+                comment, future = window.popleft()
+                future.result()
+                yield comment
+        finally:
+            # After a failure, don't start comments that will be handled again anyway
+            for _, future in window:
+                future.cancel()
+
+    def close(self):
+        """Wait for running comments and stop the pools."""
+        self.threads.shutdown()
+        self.processes.shutdown()
@@ -0,0 +1,92 @@
+import os
+import threading
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+import metrics
+
+# Load environment variables
+load_dotenv()
+MONGO_URI = os.getenv('MONGO_URI')
+DATABASE_NAME = 'reminder_bot'
+
+# Connection pool settings for the one client shared by every module
+MAX_POOL_SIZE = 10  # Main loop, posting workers and the blacklist watcher rarely need more
+MIN_POOL_SIZE = 1  # Keep one warm connection for the main loop
+MAX_IDLE_TIME_MS = 5 * 60 * 1000  # Close pooled connections idle this long
+SERVER_SELECTION_TIMEOUT_MS = 10000  # Fail a query after this long without a reachable server
+CONNECT_TIMEOUT_MS = 10000
+
+_client = None
+_lock = threading.Lock()
+
+class CommandTimer(monitoring.CommandListener):
+    """Reports the round-trip time of every MongoDB command to metrics."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.observe('mongo_command_seconds', event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        metrics.observe('mongo_command_seconds', event.duration_micros / 1e6, command=event.command_name)
+        metrics.increment('mongo_errors_total', command=event.command_name)
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MAX_POOL_SIZE,
+                    minPoolSize=MIN_POOL_SIZE,
+                    maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                    serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                    appname='reminder_ping_hive_bot',
+                    # Command monitoring is only attached when metrics are being collected
+                    event_listeners=[CommandTimer()] if metrics.enabled else []
+                )
+    return _client
+
+def get_database():
+    """Return the bot's database on the shared client."""
+    return get_client()[DATABASE_NAME]
+
+def reminders():
+    """Pending reminders, one per !remindme comment."""
+    return get_database()['reminders']
+
+def users():
+    """Per-author remindme counters."""
+    return get_database()['list_of_users']
+
+def blacklist():
+    """Users the bot ignores."""
+    return get_database()['blacklist']
+
+def reply_text():
+    """Reply templates, grouped by their 'type' field."""
+    return get_database()['reply_text']
+
+def blocks():
+    """Block cursor the listener resumes from."""
+    return get_database()['blocks']
+
+def outbox():
+    """Replies waiting to be posted."""
+    return get_database()['outbox']
+
+def processed():
+    """One record per author/permlink whose reminder was ever added, so handling a comment again adds nothing."""
+    return get_database()['processed']
+
+def close():
+    """Close the shared client, if it was ever created."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,61 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+import hive_rpc
+
+# Load environment variables
+load_dotenv()
+HIVE_POSTING_KEY = os.getenv('POSTING_KEY')
+
+# Lazily created beem clients, one per preferred node, reused for the whole process
+_clients = {}
+_lock = threading.Lock()
+_stats = {
+    'created': 0,
+    'create_seconds': 0.0,
+    'reused': 0,
+    'reuse_seconds': 0.0
+}
+
+def get_hive_client(api_index=0):
+    """Return the pooled Hive client for the api_index-th healthiest node, creating it on first use."""
+    # Imported here so runs that never post do not pay for loading beem
+    from beem import Hive
+    nodes = hive_rpc.ranked_urls()
+    node = nodes[api_index % len(nodes)]
+    started = time.perf_counter()
+    with _lock:
+        hive = _clients.get(node)
+        if hive is None:
+            # The remaining nodes let beem fail over in place if this one drops
+            hive = Hive(keys=[HIVE_POSTING_KEY], node=[node] + [url for url in nodes if url != node])
+            _clients[node] = hive
+            _stats['created'] += 1
+            _stats['create_seconds'] += time.perf_counter() - started
+            print(f"Created Hive client for {node} in {time.perf_counter() - started:.2f} seconds")
+        else:
+            _stats['reused'] += 1
+            _stats['reuse_seconds'] += time.perf_counter() - started
+    return hive
+
+def reset_hive_client(hive):
+    """Drop a client after a connection failure so the next request reconnects."""
+    with _lock:
+        for node, pooled in list(_clients.items()):
+            if pooled is hive:
+                del _clients[node]
+                print(f"Discarded Hive client for {node}")
+
+def log_client_stats():
+    """Print how much reply latency the client pool saved by skipping Hive() construction."""
+    created, reused = _stats['created'], _stats['reused']
+    if not created:
+        return
+    average_create = _stats['create_seconds'] / created
+    average_reuse = _stats['reuse_seconds'] / reused if reused else 0.0
+    saved = reused * (average_create - average_reuse)
+    print(
+        f"Hive clients: {created} created (avg {average_create:.2f}s), "
+        f"{reused} reused (avg {average_reuse * 1000:.3f}ms), ~{saved:.1f}s of reply latency saved"
+    )
@@ -0,0 +1,142 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# List of Hive API nodes shared by every module
+HIVE_API = [
+    'https://api.hive.blog',
+    'https://api.deathwing.me',
+    'https://api.openhive.network'
+]
+
+REQUEST_TIMEOUT = 15  # Seconds before a JSON-RPC request is abandoned
+POOL_SIZE = 8  # Keep-alive connections per node (covers the block prefetch pool)
+UNKNOWN_LATENCY = 1.0  # Latency assumed for nodes that have not answered yet
+LATENCY_WEIGHT = 0.3  # Weight of the newest sample in the moving latency average
+BREAKER_THRESHOLD = 3  # Consecutive failures before a node's circuit opens
+BREAKER_BASE_DELAY = 2  # Seconds a node is skipped after its circuit first opens
+BREAKER_MAX_DELAY = 300  # Upper bound for the exponential breaker backoff
+
+
+class NodeHealth:
+    """Connection pool, latency and error statistics for one API node."""
+
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+        self.latency = None  # Moving average of successful request latency (seconds)
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # Monotonic time until which the circuit is open
+
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+    def score(self):
+        """Lower is better: average latency inflated by the error rate."""
+        latency = self.latency if self.latency is not None else UNKNOWN_LATENCY
+        return latency * (1 + 4 * self.error_rate())
+
+    def is_open(self, now):
+        return now < self.open_until
+
+
+_lock = threading.Lock()
+_nodes = [NodeHealth(url) for url in HIVE_API]
+_local = threading.local()  # Per-thread details of the last successful call
+
+
+def record_success(node, latency):
+    """Update a node's statistics after a successful request and close its circuit."""
+    with _lock:
+        node.requests += 1
+        node.consecutive_failures = 0
+        node.open_until = 0.0
+        if node.latency is None:
+            node.latency = latency
+        else:
+            node.latency += LATENCY_WEIGHT * (latency - node.latency)
+
+
+def record_failure(node):
+    """Update a node's statistics after a failed request, opening its circuit if needed."""
+    with _lock:
+        node.requests += 1
+        node.errors += 1
+        node.consecutive_failures += 1
+        if node.consecutive_failures >= BREAKER_THRESHOLD:
+            exponent = node.consecutive_failures - BREAKER_THRESHOLD
+            delay = min(BREAKER_BASE_DELAY * 2 ** exponent, BREAKER_MAX_DELAY)
+            node.open_until = time.monotonic() + delay
+            print(f"Circuit opened for {node.url} for {delay} seconds after {node.consecutive_failures} failures.")
+
+
+def ranked_nodes(offset=0):
+    """Return nodes ordered by health: closed circuits by score, then open ones by reopen time.
+
+    The healthy part of the ranking is rotated by offset so concurrent callers can
+    spread their requests over several nodes.
+    """
+    now = time.monotonic()
+    with _lock:
+        healthy = sorted((node for node in _nodes if not node.is_open(now)), key=NodeHealth.score)
+        tripped = sorted((node for node in _nodes if node.is_open(now)), key=lambda node: node.open_until)
+    if healthy and offset:
+        offset %= len(healthy)
+        healthy = healthy[offset:] + healthy[:offset]
+    return healthy + tripped
+
+
+def last_response_size():
+    """Return the size in bytes of the last successful response received on this thread."""
+    return getattr(_local, 'response_bytes', 0)
+
+
+def ranked_urls(offset=0):
+    """Return the node URLs ordered by health, for clients that manage their own connections."""
+    return [node.url for node in ranked_nodes(offset)]
+
+
+def call(method, params, accept=None, retries=10, offset=0):
+    """Send a JSON-RPC request to the healthiest node, failing over until one answers.
+
+    accept is an optional check on the result; results it rejects count as node
+    failures. Returns a (result, url) tuple.
+    """
+    data = {
+        "jsonrpc": "2.0",
+        "method": method,
+        "params": params,
+        "id": 1
+    }
+    while retries > 0:
+        node = ranked_nodes(offset)[0]
+        wait = node.open_until - time.monotonic()
+        if wait > 0:
+            # Every circuit is open; back off until the first one may be retried
+            print(f"All Hive API nodes are unavailable. Retrying {node.url} in {wait:.1f} seconds...")
+            time.sleep(wait)
+
+        started = time.monotonic()
+        try:
+            raw = node.session.post(node.url, json=data, timeout=REQUEST_TIMEOUT)
+            response = raw.json()
+            result = response.get('result')
+            if result is not None and (accept is None or accept(result)):
+                record_success(node, time.monotonic() - started)
+                metrics.observe('rpc_latency_seconds', time.monotonic() - started, method=method, node=node.url)
+                _local.response_bytes = len(raw.content)
+                return result, node.url
+            print(f"Unusable response for {method} from {node.url}: {response.get('error', 'empty result')}. Retrying...")
+        except Exception as e:
+            print(f"Exception while calling {method} on {node.url}: {e}")
+        record_failure(node)
+        metrics.increment('rpc_errors_total', method=method, node=node.url)
+        retries -= 1
+
+    print("Max retries exceeded. Aborting.")
+    raise Exception(f"Failed to call {method} after multiple retries.")
@@ -1,131 +1,237 @@
-import requests
 import time
-from datetime import datetime
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
 import re
-from beem import Hive
-from pymongo import MongoClient
-import os
-from dotenv import load_dotenv
-
-SLEEP_INTERVAL = 5
-HIVE_API = [ 
-    'https://api.hive.blog', 
-    'https://api.deathwing.me',
-    'https://api.openhive.network'
-]
-hive = Hive()
-
-# Load environment variables
-load_dotenv()
-MONGO_URI = os.getenv('MONGO_URI')
-
-# Initialize MongoDB client
-client = MongoClient(MONGO_URI)
-db = client['reminder_bot']  # Database name
-blacklist_collection = db['blacklist']  # Blacklist collection
+
+import hive_rpc
+import block_store
+import metrics
+from batch_sizer import BatchSizer
+import db
+
+BLOCK_INTERVAL = 3  # Seconds between Hive blocks
+BLOCK_POLL_MARGIN = 0.5  # Extra wait after a block is due so nodes have it
+PREFETCH_DEPTH = 4  # Block-range requests kept in flight while catching up
+MAX_BLOCKS_PER_REQUEST = 1000  # Node limit for block_api.get_block_range
+BLACKLIST_TTL = 300  # Seconds between blacklist reloads when change streams are unavailable
+REMINDME_PATTERN = re.compile(r'!remindme', re.IGNORECASE)  # Searched in raw bodies without lowercasing them
+
+# Block prefetch pipeline state
+_fetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_DEPTH)
+_prefetched = {}  # start_block -> (end_block, Future of the fetched blocks)
+_api_offsets = itertools.count()  # Spreads concurrent requests across healthy nodes
+_head_block = None  # Latest head block number seen by get_latest_block_num
+_head_block_time = None  # Chain time of that head block
+_archive_only = False  # Serve blocks from the block store only, never from the API nodes
+
+# Sizes block batches from the lag to head and the measured cost of block range requests
+batch_sizer = BatchSizer(max_size=MAX_BLOCKS_PER_REQUEST)
+
+# Blacklist cache state
+_blacklist = None  # Blacklisted usernames
+_blacklist_ids = {}  # Blacklist document id -> username, to apply deletes from the change stream
+_blacklist_loaded_at = None
+_blacklist_watching = False
+_blacklist_watcher = None
 
 def get_latest_block_num():
     """Get the latest block number from the HIVE blockchain."""
-    data = {
-        "jsonrpc": "2.0",
-        "method": "condenser_api.get_dynamic_global_properties",
-        "params": [],
-        "id": 1
-    }
-    retries = 10
-    api_index = 0
-    while retries > 0:
-        try:
-            response = requests.post(HIVE_API[api_index % len(HIVE_API)], json=data).json()
-            result = response.get('result')
-            if result:
-                return result['head_block_number']
-            else:
-                print(f"Failed to get latest block number from {HIVE_API[api_index % len(HIVE_API)]}. Retrying...")
-                time.sleep(SLEEP_INTERVAL / 10)
-                retries -= 1
-                api_index += 1  # Switch to the next API on each retry
-        except Exception as e:
-            print(f"Exception while fetching latest block number from {HIVE_API[api_index % len(HIVE_API)]}: {e}")
-            time.sleep(SLEEP_INTERVAL / 10)
-            retries -= 1
-            api_index += 1  # Switch to the next API on each retry
-
-    print("Max retries exceeded. Aborting.")
-    raise Exception("Failed to fetch latest block number after multiple retries.")
-
-def get_block_range(start_block, end_block):
-    """Fetch a range of blocks from the HIVE blockchain using block_api.get_block_range."""
-    
-    if start_block == end_block:
-        print(f"Waiting for more blocks before fetching...")
-        time.sleep(SLEEP_INTERVAL)
-    
-    data = {
-        "jsonrpc": "2.0",
-        "method": "block_api.get_block_range",
-        "params": {
-            "starting_block_num": start_block,
-            "count": end_block - start_block + 1
-        },
-        "id": 1
+    result, _ = hive_rpc.call("condenser_api.get_dynamic_global_properties", [])
+    return update_head(result)
+
+def update_head(properties):
+    """Remember the head block from a get_dynamic_global_properties result and return its number."""
+    global _head_block, _head_block_time
+    _head_block = properties['head_block_number']
+    _head_block_time = datetime.strptime(properties['time'], '%Y-%m-%dT%H:%M:%S')
+    return _head_block
+
+def seconds_until_next_block():
+    """Return how long to wait before the block after the last seen head should be available."""
+    if _head_block_time is None:
+        return BLOCK_INTERVAL
+    next_block_time = _head_block_time + timedelta(seconds=BLOCK_INTERVAL + BLOCK_POLL_MARGIN)
+    return max((next_block_time - datetime.utcnow()).total_seconds(), BLOCK_POLL_MARGIN)
+
+def get_block_range(start_block, end_block, api_index=0):
+    """Fetch a range of blocks from the HIVE blockchain using block_api.get_block_range.
+
+    Nodes that return fewer blocks than requested (e.g. ones lagging behind the
+    head) are skipped, so a range is never silently cut short. Ranges already in
+    the block store are read from disk, and fetched ranges are written to it.
+    """
+    blocks = block_store.get_blocks(start_block, end_block)
+    if blocks is not None:
+        return blocks
+    if _archive_only:
+        raise Exception(f"Blocks {start_block} to {end_block} are not in the block store")
+
+    params = {
+        "starting_block_num": start_block,
+        "count": end_block - start_block + 1
     }
-    retries = 10
-    api_index = 0
-    while retries > 0:
-        try:
-            response = requests.post(HIVE_API[api_index % len(HIVE_API)], json=data).json()
-            result = response.get('result')
-            if result['blocks']:
-                print(f"Fetched block range {start_block} to {end_block} from {HIVE_API[api_index % len(HIVE_API)]}")
-                return result['blocks']
-            else:
-                print(f"Failed to fetch block range {start_block} to {end_block} from {HIVE_API[api_index % len(HIVE_API)]}. Retrying...")
-                time.sleep(SLEEP_INTERVAL)
-                retries -= 1
-                api_index += 1  # Switch to the next API on each retry
-        except Exception as e:
-            print(f"Exception while fetching block range {start_block} to {end_block} from {HIVE_API[api_index % len(HIVE_API)]}: {e}")
-            time.sleep(SLEEP_INTERVAL)
-            retries -= 1
-            api_index += 1  # Switch to the next API on each retry
-
-    print("Max retries exceeded. Aborting.")
-    raise Exception("Failed to fetch block data after multiple retries.")
+    started = time.monotonic()
+    result, node = hive_rpc.call(
+        "block_api.get_block_range", params,
+        accept=lambda result: len(result.get('blocks') or []) == params['count'], offset=api_index
+    )
+    batch_sizer.record_fetch(params['count'], time.monotonic() - started, hive_rpc.last_response_size())
+    print(f"Fetched block range {start_block} to {end_block} from {node}")
+    block_store.put_blocks(start_block, result['blocks'])
+    return result['blocks']
+
+def set_archive_only(archive_only):
+    """Make get_block_range fail instead of fetching blocks missing from the block store."""
+    global _archive_only
+    _archive_only = archive_only
+
+def submit_block_range(start_block, end_block):
+    """Queue a block range fetch on the prefetch pool, reusing one already in flight.
+
+    A range in flight from start_block is reused even if the batch size changed
+    since it was queued; the end block of the range actually used is returned.
+    """
+    entry = _prefetched.get(start_block)
+    if entry is None:
+        api_index = next(_api_offsets) % len(hive_rpc.HIVE_API)
+        entry = (end_block, _fetch_executor.submit(get_block_range, start_block, end_block, api_index))
+        _prefetched[start_block] = entry
+    return entry[0]
+
+def stream_blocks(start_block, end_block):
+    """Yield blocks in order while keeping up to PREFETCH_DEPTH range requests in flight.
+
+    Full-size ranges past end_block are prefetched up to the last known head block,
+    so the next call with the following range finds its blocks already downloaded.
+    """
+    batch_size = min(end_block - start_block + 1, MAX_BLOCKS_PER_REQUEST)
+    limit = max(end_block, _head_block or end_block)
+
+    # Forget prefetched ranges the caller has moved past
+    for key in [key for key in _prefetched if key < start_block]:
+        _prefetched.pop(key)[1].cancel()
+
+    in_flight = deque()
+    next_start = start_block
+    while in_flight or next_start <= end_block:
+        while len(in_flight) < PREFETCH_DEPTH and next_start <= limit:
+            next_end = next_start + batch_size - 1
+            if next_start > end_block and next_end > limit:
+                break  # Only prefetch complete ranges beyond the requested one
+            next_end = min(next_end, end_block) if next_start <= end_block else next_end
+            in_flight.append(next_start)
+            next_start = submit_block_range(next_start, next_end) + 1
+        if not in_flight or in_flight[0] > end_block:
+            break  # The rest is lookahead for the next call
+        range_start = in_flight.popleft()
+        range_end, future = _prefetched.pop(range_start)
+        blocks = future.result()
+        if range_end > end_block:
+            # Prefetched with a larger batch size; keep the blocks past end_block for the next call
+            rest = Future()
+            rest.set_result(blocks[end_block - range_start + 1:])
+            _prefetched[end_block + 1] = (range_end, rest)
+            blocks = blocks[:end_block - range_start + 1]
+        yield from blocks
 
 def listen_for_comments(start_block, end_block, blacklist):
     """Listen for comments in a range of blocks and process them."""
-    blocks = get_block_range(start_block, end_block)
+    return comments_in_blocks(stream_blocks(start_block, end_block), blacklist)
+
+def comments_in_blocks(blocks, blacklist):
+    """Yield the !remindme replies in blocks as comment dicts.
+
+    Operations are filtered on the raw block data first; only replies that
+    mention !remindme from authors outside the blacklist are turned into
+    comment dicts.
+    """
+    find_command = REMINDME_PATTERN.search
     for block in blocks:
         block_timestamp = block['timestamp']  # Use timestamp directly
+        block_num = None
+        scanned = 0
         for transaction in block['transactions']:
+            scanned += len(transaction['operations'])
             for operation in transaction['operations']:
-                if operation['type'] == 'comment_operation':
-                    comment_data = operation['value']
-                    if comment_data['parent_author'] != '':
-                        comment = {
-                            'author': comment_data['author'],
-                            'permlink': comment_data['permlink'],
-                            'parent_author': comment_data['parent_author'],
-                            'parent_permlink': comment_data['parent_permlink'],
-                            'body': comment_data['body'],
-                            'metadata': comment_data["json_metadata"],
-                            'block_timestamp': block_timestamp
-                        }
-                        if comment['author'] not in blacklist:
-                            yield comment
-                        else:
-                            print(f"Blacklisted user: {comment['author']}")
+                if operation['type'] != 'comment_operation':
+                    continue
+                comment_data = operation['value']
+                if not comment_data['parent_author'] or not find_command(comment_data['body']):
+                    continue
+                if comment_data['author'] in blacklist:
+                    print(f"Blacklisted user: {comment_data['author']}")
+                    continue
+                if block_num is None:
+                    block_num = int(block['block_id'][:8], 16)  # Block ids start with the block number
+                yield {
+                    'author': comment_data['author'],
+                    'permlink': comment_data['permlink'],
+                    'parent_author': comment_data['parent_author'],
+                    'parent_permlink': comment_data['parent_permlink'],
+                    'body': comment_data['body'],
+                    'metadata': comment_data["json_metadata"],
+                    'block_timestamp': block_timestamp,
+                    'block_num': block_num
+                }
+        metrics.observe('block_operations', scanned)
+
+def fetch_blacklist():
+    """Read the blacklisted usernames from MongoDB, keyed by document id."""
+    return {doc['_id']: doc['username'] for doc in db.blacklist().find({}, {'username': 1})}
+
+def replace_blacklist(ids):
+    """Swap in a freshly loaded blacklist."""
+    global _blacklist, _blacklist_ids, _blacklist_loaded_at
+    _blacklist_ids, _blacklist = ids, set(ids.values())
+    _blacklist_loaded_at = time.monotonic()
+
+def apply_blacklist_change(change):
+    """Update the cached blacklist from one change stream event."""
+    doc_id = change['documentKey']['_id']
+    old_username = _blacklist_ids.pop(doc_id, None)
+    document = change.get('fullDocument') or {}
+    if change['operationType'] != 'delete' and 'username' in document:
+        _blacklist_ids[doc_id] = document['username']
+        _blacklist.add(document['username'])
+    if old_username is not None and old_username not in _blacklist_ids.values():
+        _blacklist.discard(old_username)
+
+def watch_blacklist():
+    """Keep the cached blacklist current from a MongoDB change stream until it closes."""
+    global _blacklist_watching
+    try:
+        with db.blacklist().watch(full_document='updateLookup') as stream:
+            # Reload once the stream is open so no change between the two is missed
+            replace_blacklist(fetch_blacklist())
+            _blacklist_watching = True
+            for change in stream:
+                if change['operationType'] in ('insert', 'update', 'replace', 'delete'):
+                    apply_blacklist_change(change)
+                elif change['operationType'] in ('drop', 'rename', 'invalidate'):
+                    break
+    except Exception as e:
+        print(f"Blacklist change stream unavailable, reloading every {BLACKLIST_TTL} seconds instead: {e}")
+    _blacklist_watching = False
 
 def load_blacklist():
-    """Load the blacklist of users from MongoDB."""
-    blacklist = set()
+    """Return the cached set of blacklisted users.
+
+    The set is loaded once and then kept current by a change stream; where change
+    streams are unavailable it is reloaded every BLACKLIST_TTL seconds.
+    """
+    global _blacklist_watcher
+    if _blacklist is not None and (_blacklist_watching or time.monotonic() - _blacklist_loaded_at < BLACKLIST_TTL):
+        return _blacklist
     try:
         # Fetch the blacklist from MongoDB
-        blacklist_docs = blacklist_collection.find()
-        for doc in blacklist_docs:
-            blacklist.add(doc['username'])  # Assuming your MongoDB documents have a 'username' field
+        replace_blacklist(fetch_blacklist())
     except Exception as e:
         print(f"Error loading blacklist from MongoDB: {e}")
-    return blacklist
-
+        return _blacklist if _blacklist is not None else set()
+    if _blacklist_watcher is None:
+        _blacklist_watcher = threading.Thread(target=watch_blacklist, name="blacklist-watcher", daemon=True)
+        _blacklist_watcher.start()
+    return _blacklist
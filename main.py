@@ -1,14 +1,25 @@
 import os
 import time
+import signal
+import argparse
 import threading
-from listener import listen_for_comments, get_latest_block_num, load_blacklist
-from reply import handle_new_comment
+from datetime import datetime
+from listener import listen_for_comments, get_latest_block_num, load_blacklist, seconds_until_next_block, set_archive_only, batch_sizer
+from reply import handle_new_comment, flush_writes, discard_writes, set_dry_run
 from resumption import load_last_block, save_last_block
-from reminder_handler import process_reminders
+from reminder_handler import process_reminders, next_due_time
+from hive_client import log_client_stats
+import outbox
+import db
+import block_store
+import metrics
+from comment_workers import CommentWorkers
 
 # Configuration
-BLOCK_RANGE = 50
 QUIT_TIMEOUT = 30  # 30 seconds timeout for quitting on error
+MAX_IDLE = 30  # Longest the daemon sleeps without polling the head block (seconds)
+ERROR_BACKOFF = 5  # First wait after an error in daemon mode, doubled up to MAX_IDLE
+SHUTDOWN_TIMEOUT = 20  # Seconds the posting workers get to drain the outbox on shutdown
 
 def quit_if_timeout():
     """Wait for user input or timeout to quit the application."""
@@ -22,49 +33,182 @@ def quit_if_timeout():
         print("Timeout reached. Exiting the application.")
         os._exit(1)
 
-def main():
-    # Load the last processed block number or get the latest block number if not available
-    latest_block_num = get_latest_block_num()
+def idle_time(follow_blocks=True):
+    """Seconds to sleep at the head: until the next block is produced or a reminder is due."""
+    wait = seconds_until_next_block() if follow_blocks else MAX_IDLE
+    due = next_due_time()
+    if due is not None:
+        wait = min(wait, (due - datetime.utcnow()).total_seconds())
+    return min(max(wait, 0), MAX_IDLE)
 
-    last_block = load_last_block() or latest_block_num
-    end_block = last_block + BLOCK_RANGE - 1
-    
-    if latest_block_num < end_block:
-        end_block = latest_block_num
-        if last_block > latest_block_num:
-            last_block = latest_block_num
+def save_checkpoint(block_num):
+    """Write the work buffered for the blocks before block_num, then make block_num the next block to process.
+
+    Everything written is idempotent (reminders are upserted by author and
+    permlink, replies by outbox key), so blocks handled again after a crash
+    between the two writes produce no duplicates.
+    """
+    flush_writes()
+    save_last_block(block_num)
+    return block_num
+
+def handle_comments(comments, workers=None):
+    """Handle comments one by one, or concurrently on workers, yielding each in order once it is handled."""
+    if workers is not None:
+        yield from workers.handle(comments)
+        return
+    for comment in comments:
+        handle_new_comment(comment)
+        yield comment
+
+def make_comment_workers(count):
+    """Return CommentWorkers for count > 1, or None to handle comments on the main thread."""
+    return CommentWorkers(count) if count > 1 else None
+
+def process_blocks(start_block, end_block, workers=None):
+    """Handle the comments in a block range and return the next block to process.
+
+    If handling fails, the blocks before the failing one are checkpointed before
+    the error is raised, so a restart resumes from there.
+    """
+    resume_block = start_block
+    try:
+        comments = listen_for_comments(start_block, end_block, load_blacklist())
+        for comment in handle_comments(comments, workers):
+            resume_block = comment['block_num']  # Every block before this one is fully handled
+    except Exception:
+        if resume_block > start_block:
+            save_checkpoint(resume_block)
+        raise
+    metrics.increment('blocks_processed_total', end_block - start_block + 1)
+    return save_checkpoint(end_block + 1)
+
+def replay(start_block, end_block, worker_count=1, write=False):
+    """Run archived blocks through the comment pipeline at disk speed.
+
+    Blocks come only from the block store. The block cursor is left alone and no
+    replies are posted. Reminders and queued replies are only written with
+    write=True, which must never point at the live database: reminders that
+    already fired would be stored and fired again.
+    """
+    if not block_store.enabled():
+        print("Set BLOCK_STORE_DIR to replay blocks from the local archive.")
+        return
+    set_archive_only(True)
+    set_dry_run(not write)
+    metrics.start()
+    workers = make_comment_workers(worker_count)
+    started = time.monotonic()
+    next_block = start_block
+    while next_block <= end_block:
+        batch_end = next_block + batch_sizer.next_size(end_block - next_block + 1) - 1
+        comments = listen_for_comments(next_block, batch_end, load_blacklist())
+        for _ in handle_comments(comments, workers):
+            pass
+        flush_writes()
+        metrics.increment('blocks_processed_total', batch_end - next_block + 1)
+        next_block = batch_end + 1
+    elapsed = time.monotonic() - started
+    replayed = end_block - start_block + 1
+    print(f"Replayed {replayed} blocks in {elapsed:.2f} seconds ({replayed / max(elapsed, 1e-9):.0f} blocks/s)")
+    if workers is not None:
+        workers.close()
+    metrics.stop()
+    block_store.close()
+    db.close()
+
+def main(once=False, worker_count=1, follow_blocks=True):
+    """Follow the chain and fire reminders. With once=True, exit after catching up to the head block.
+
+    With worker_count > 1, comments are handled concurrently by that many workers.
+    With follow_blocks=False, only due reminders are fired; another instance
+    follows the chain and owns the block cursor.
+    """
+    stop_event = threading.Event()
+    if not once:
+        def request_stop(signum, frame):
+            print("Shutdown requested. Finishing the current batch...")
+            stop_event.set()
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+    # Load the next block to process, or start at the latest block if there is none
+    latest_block_num = next_block = None
+    if follow_blocks:
+        latest_block_num = get_latest_block_num()
+        next_block = min(load_last_block() or latest_block_num, latest_block_num)
+
+    # Replies are posted by background workers draining the outbox
+    outbox.start_workers()
+    metrics.start()
+    workers = make_comment_workers(worker_count) if follow_blocks else None
 
     # Start listening for comments
-    while True:
+    error_backoff = ERROR_BACKOFF
+    while not stop_event.is_set():
         try:
-            comments = listen_for_comments(last_block, end_block, load_blacklist())
-            for comment in comments:
-                handle_new_comment(comment)
+            if follow_blocks and next_block <= latest_block_num:
+                lag = latest_block_num - next_block + 1
+                end_block = next_block + batch_sizer.next_size(lag) - 1
+                print(f"Processing blocks {next_block} to {end_block} ({end_block - next_block + 1} blocks, {lag} behind head)")
+                metrics.set_gauge('block_lag', lag)
+                metrics.set_gauge('block_batch_size', end_block - next_block + 1)
+                next_block = process_blocks(next_block, end_block, workers)
 
             # Process reminders
             process_reminders()
 
-            # Update the block range for the next iteration
-            last_block = end_block + 1
-            end_block = last_block + BLOCK_RANGE - 1
-            
-            latest_block_num = get_latest_block_num()
-            if latest_block_num < end_block:
-                end_block = latest_block_num
-                if last_block > latest_block_num:
-                    last_block = latest_block_num
-                
-            # Save last_block before exiting if reached the latest block
-            save_last_block(end_block + 1)
-            if last_block == latest_block_num:
-                print("Last block is the same as the latest block. Exiting the application.")
-                save_last_block(last_block)
-                break  # Quit the loop to exit
+            if not follow_blocks or next_block > latest_block_num:
+                if once:
+                    print("Last block is the same as the latest block. Exiting the application." if follow_blocks
+                          else "Due reminders are queued. Exiting the application.")
+                    break  # Quit the loop to exit
+                # At the head: sleep until the next block or the next due reminder
+                stop_event.wait(idle_time(follow_blocks))
+
+            if follow_blocks:
+                latest_block_num = get_latest_block_num()
+            error_backoff = ERROR_BACKOFF
 
         except Exception as e:
             print(f"An error occurred: {e}")
-            quit_if_timeout()  # Wait for timeout or user input to quit
+            discard_writes()  # Unsaved blocks are processed again; doing so is idempotent
+            if once:
+                quit_if_timeout()  # Wait for timeout or user input to quit
+            else:
+                print(f"Retrying in {error_backoff} seconds...")
+                stop_event.wait(error_backoff)
+                error_backoff = min(error_backoff * 2, MAX_IDLE)
 
-if __name__ == "__main__":
-    main()
+    if once:
+        outbox.stop_workers()
+    else:
+        outbox.stop_workers(SHUTDOWN_TIMEOUT)
+    if workers is not None:
+        workers.close()
+    log_client_stats()
+    metrics.stop()
+    block_store.close()
+    db.close()
 
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Hive !RemindMe bot")
+    arg_parser.add_argument('--once', action='store_true', help="exit after catching up to the head block (cron mode)")
+    arg_parser.add_argument('--replay', nargs=2, type=int, metavar=('START', 'END'),
+                            help="process blocks START to END from the local block store only, then exit")
+    arg_parser.add_argument('--replay-writes', action='store_true',
+                            help="let --replay write reminders and queued replies (use a scratch MONGO_URI)")
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help="handle comments concurrently on this many worker threads and parser processes")
+    arg_parser.add_argument('--async', dest='use_async', action='store_true',
+                            help="run on the asyncio runtime (uses aiohttp and motor when installed)")
+    arg_parser.add_argument('--reminders-only', action='store_true',
+                            help="only fire due reminders; leave following blocks to another instance")
+    args = arg_parser.parse_args()
+    if args.replay:
+        replay(*args.replay, worker_count=args.workers, write=args.replay_writes)
+    elif args.use_async:
+        import async_runtime
+        async_runtime.run(once=args.once, follow_blocks=not args.reminders_only)
+    else:
+        main(once=args.once, worker_count=args.workers, follow_blocks=not args.reminders_only)
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+METRICS_PORT = os.getenv('METRICS_PORT')  # Serve Prometheus text on this port
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_FILE = os.getenv('METRICS_FILE')  # Dump JSON snapshots to this file
+METRICS_DUMP_INTERVAL = 60  # Seconds between JSON snapshots
+
+# Metrics are only recorded when an endpoint or dump file is configured
+enabled = bool(METRICS_PORT or METRICS_FILE)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS = {
+    'block_operations': (0, 10, 25, 50, 100, 250, 500, 1000, 2500),
+    'reminder_lateness_seconds': (1, 5, 15, 30, 60, 300, 900, 3600, 6 * 3600, 24 * 3600)
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_gauges = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_null_span = nullcontext()
+_server = None
+_stop_event = threading.Event()
+
+def label_key(labels):
+    """Return labels in a hashable, order-independent form."""
+    return tuple(sorted(labels.items()))
+
+def increment(name, value=1, **labels):
+    """Add value to a counter."""
+    if not enabled:
+        return
+    key = (name, label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to value."""
+    if not enabled:
+        return
+    with _lock:
+        _gauges[(name, label_key(labels))] = value
+
+def observe(name, value, **labels):
+    """Record one value in a histogram."""
+    if not enabled:
+        return
+    buckets = BUCKETS.get(name, DEFAULT_BUCKETS)
+    key = (name, label_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(buckets) + 2)
+        index = bisect.bisect_left(buckets, value)
+        if index < len(buckets):
+            histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+@contextmanager
+def timed(name, labels):
+    """Observe how long the enclosed block took."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def span(name, **labels):
+    """Time the enclosed block into the histogram name (in seconds)."""
+    if not enabled:
+        return _null_span
+    return timed(name, labels)
+
+def format_labels(labels, extra=()):
+    """Format label pairs as a Prometheus label set."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value)}"' for key, value in pairs) + '}'
+
+def render_prometheus():
+    """Return every metric in the Prometheus text exposition format."""
+    with _lock:
+        counters, gauges = dict(_counters), dict(_gauges)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+    lines = []
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        for name in sorted({name for name, _ in values}):
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in values.items():
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        buckets = BUCKETS.get(name, DEFAULT_BUCKETS)
+        for (metric, labels), values in histograms.items():
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{name}_sum{format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{format_labels(labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
+
+def snapshot():
+    """Return every metric as a JSON-serializable dict."""
+    with _lock:
+        return {
+            'time': time.time(),
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in _counters.items()],
+            'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in _gauges.items()],
+            'histograms': [
+                {'name': name, 'labels': dict(labels), 'buckets': list(BUCKETS.get(name, DEFAULT_BUCKETS)),
+                 'counts': values[:-2], 'sum': values[-2], 'count': values[-1]}
+                for (name, labels), values in _histograms.items()
+            ]
+        }
+
+def dump_json(path):
+    """Write a snapshot to path, replacing the previous one atomically."""
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(temporary, path)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the Prometheus text format on every GET."""
+
+    def do_GET(self):
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the bot's log
+
+def dump_loop(stop_event):
+    """Write a JSON snapshot every METRICS_DUMP_INTERVAL seconds until stopped."""
+    while not stop_event.wait(METRICS_DUMP_INTERVAL):
+        try:
+            dump_json(METRICS_FILE)
+        except OSError as e:
+            print(f"Could not write metrics to {METRICS_FILE}: {e}")
+
+def start():
+    """Start the configured metrics endpoint and JSON dumper in the background."""
+    global _server
+    if METRICS_PORT and _server is None:
+        _server = ThreadingHTTPServer((METRICS_HOST, int(METRICS_PORT)), MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_FILE:
+        _stop_event.clear()
+        threading.Thread(target=dump_loop, args=(_stop_event,), name="metrics-dump", daemon=True).start()
+
+def stop():
+    """Stop the endpoint and write a final JSON snapshot."""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server = None
+    if METRICS_FILE:
+        _stop_event.set()
+        try:
+            dump_json(METRICS_FILE)
+        except OSError as e:
+            print(f"Could not write metrics to {METRICS_FILE}: {e}")
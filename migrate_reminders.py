@@ -0,0 +1,70 @@
+import argparse
+from pymongo import UpdateOne
+from reminder_handler import (
+    REMINDER_BODY_CHARS, normalize_target_timestamps, shard_key, to_datetime
+)
+import db
+
+MIGRATION_BATCH_SIZE = 1000  # Reminder updates sent per bulk_write
+OBSOLETE_FIELDS = ('parent_author', 'parent_permlink')  # Stored by older versions, never read when firing
+
+def compact_update(reminder, body_chars):
+    """Return the update that brings a stored reminder to the compact schema, or None if it already is."""
+    set_fields, unset_fields = {}, {}
+    for field in OBSOLETE_FIELDS:
+        if field in reminder:
+            unset_fields[field] = ''
+    if isinstance(reminder.get('block_timestamp'), str):
+        try:
+            set_fields['block_timestamp'] = to_datetime(reminder['block_timestamp'])
+        except ValueError:
+            unset_fields['block_timestamp'] = ''
+    body = reminder.get('body')
+    if body is not None:
+        if body_chars <= 0:
+            unset_fields['body'] = ''
+        elif len(body) > body_chars:
+            set_fields['body'] = body[:body_chars]
+    if 'shard_key' not in reminder and 'author' in reminder:
+        set_fields['shard_key'] = shard_key(reminder['author'])
+
+    update = {}
+    if set_fields:
+        update['$set'] = set_fields
+    if unset_fields:
+        update['$unset'] = unset_fields
+    return update or None
+
+def migrate(body_chars=REMINDER_BODY_CHARS, dry_run=False):
+    """Convert every stored reminder to the compact schema. Returns the number of reminders changed."""
+    if not dry_run:
+        # String target_timestamps become datetimes; unparseable ones are deleted
+        normalize_target_timestamps()
+
+    projection = {field: 1 for field in OBSOLETE_FIELDS + ('author', 'block_timestamp', 'body', 'shard_key')}
+    operations, changed = [], 0
+    for reminder in db.reminders().find({}, projection).batch_size(MIGRATION_BATCH_SIZE):
+        update = compact_update(reminder, body_chars)
+        if update is None:
+            continue
+        changed += 1
+        operations.append(UpdateOne({'_id': reminder['_id']}, update))
+        if len(operations) >= MIGRATION_BATCH_SIZE:
+            if not dry_run:
+                db.reminders().bulk_write(operations, ordered=False)
+            operations = []
+    if operations and not dry_run:
+        db.reminders().bulk_write(operations, ordered=False)
+    return changed
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Convert stored reminders to the compact schema")
+    arg_parser.add_argument('--body-chars', type=int, default=REMINDER_BODY_CHARS,
+                            help="characters of the comment body to keep (default: REMINDER_BODY_CHARS, 0 drops it)")
+    arg_parser.add_argument('--dry-run', action='store_true', help="count the reminders that would change without writing")
+    args = arg_parser.parse_args()
+    try:
+        changed = migrate(args.body_chars, args.dry_run)
+        print(f"{'Would compact' if args.dry_run else 'Compacted'} {changed} reminders.")
+    finally:
+        db.close()
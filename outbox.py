@@ -0,0 +1,233 @@
+import os
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, ASCENDING, UpdateMany, UpdateOne
+import reply_queue
+import db
+import metrics
+
+POSTING_WORKERS = 1  # Posting threads; replies from one account are serialized by the rate limiter anyway
+CLAIM_BATCH = 40  # Outbox items claimed per drain
+LEASE_SECONDS = 300  # A claimed item is handed to another worker if not finished by then
+RENEW_INTERVAL = LEASE_SECONDS // 3  # Seconds between lease renewals of the replies still queued
+RETRY_BACKOFF = 300  # Seconds before an item whose reply failed is claimed again, doubled per failure
+MAX_RETRY_BACKOFF = 6 * 60 * 60
+POLL_INTERVAL = 1  # Longest a worker idles before checking the outbox again (seconds)
+DONE_RETENTION_DAYS = 30  # Finished items are kept this long so re-enqueues stay no-ops
+# Fields the posting workers read from a claimed item
+ITEM_FIELDS = {
+    'kind': 1, 'parent_author': 1, 'parent_permlink': 1, 'permlink': 1, 'body': 1,
+    'reminder_id': 1, 'due_at': 1, 'failures': 1
+}
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"  # Recorded on the items and reminders this process leases
+
+_lock = threading.Lock()  # reply_queue is shared by all posting workers
+_workers = []
+_completed = []  # Items posted during the current drain, written back by record_results()
+_failed = []  # (item, permanent) for replies that failed during the current drain
+_renewed_at = 0.0  # time.monotonic() of the last lease renewal
+_stop_event = threading.Event()
+_indexes_ready = False
+
+def ensure_indexes():
+    """Create the indexes the workers claim by and expire finished items with."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    db.outbox().create_index([('status', ASCENDING), ('lease_until', ASCENDING)])
+    db.outbox().create_index('completed_at', expireAfterSeconds=DONE_RETENTION_DAYS * 24 * 60 * 60)
+    _indexes_ready = True
+
+def reply_key(kind, author, permlink):
+    """Return the idempotency key of a reply to author/permlink."""
+    return f"{kind}:{author}/{permlink}"
+
+def enqueue(kind, parent_author, parent_permlink, body, reminder_id=None, due_at=None):
+    """Durably queue a reply. Enqueuing the same kind of reply to the same comment twice is a no-op.
+
+    due_at is when the reply should ideally be posted; it is used to measure how
+    late reminders are delivered. The reply's permlink is fixed here and stored
+    with the item, so every attempt to post it targets the same reply.
+    """
+    if not body:
+        print(f"No reply text for {kind} reply to {parent_author}/{parent_permlink}. Skipping it.")
+        return None
+    ensure_indexes()
+    key = reply_key(kind, parent_author, parent_permlink)
+    result = db.outbox().update_one(
+        {'_id': key},
+        {'$setOnInsert': {
+            'kind': kind,
+            'parent_author': parent_author,
+            'parent_permlink': parent_permlink,
+            'permlink': reply_queue.reply_permlink(kind, parent_author, parent_permlink),
+            'body': body,
+            'reminder_id': reminder_id,
+            'due_at': due_at,
+            'status': 'pending',
+            'lease_until': datetime.utcnow(),
+            'created_at': datetime.utcnow()
+        }},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        print(f"Queued {kind} reply to {parent_author}/{parent_permlink}")
+    return key
+
+def finished(keys):
+    """Return which of keys belong to items that were already posted or given up on."""
+    if not keys:
+        return set()
+    return {item['_id'] for item in db.outbox().find(
+        {'_id': {'$in': list(keys)}, 'status': {'$in': ['done', 'failed']}}, {'_id': 1}
+    )}
+
+def claim(limit):
+    """Lease up to limit pending items, including ones whose previous lease expired."""
+    items = []
+    while len(items) < limit:
+        now = datetime.utcnow()
+        item = db.outbox().find_one_and_update(
+            {'status': {'$in': ['pending', 'sending']}, 'lease_until': {'$lte': now}},
+            {'$set': {'status': 'sending', 'lease_until': now + timedelta(seconds=LEASE_SECONDS), 'leased_by': WORKER_ID}},
+            projection=ITEM_FIELDS,
+            sort=[('lease_until', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if item is None:
+            break
+        items.append(item)
+    return items
+
+def complete(item):
+    """Record that an item was posted; written back with the rest of the drain."""
+    _completed.append(item)
+    if item.get('due_at') is not None:
+        metrics.observe('reminder_lateness_seconds', (datetime.utcnow() - item['due_at']).total_seconds())
+    print(f"Replied to {item['parent_author']}/{item['parent_permlink']} ({item['kind']})")
+
+def fail(item, permanent=False):
+    """Record that an item's reply could not be posted.
+
+    Permanent failures, such as a deleted parent comment, are given up on;
+    anything else is retried after a backoff.
+    """
+    _failed.append((item, permanent))
+
+def renew_leases():
+    """Extend the leases of the replies waiting in reply_queue and drop the ones this worker lost.
+
+    A reply can wait longer than LEASE_SECONDS for the rate limiter or a retry;
+    without renewal another instance would claim and post it as well.
+    """
+    global _renewed_at
+    keys = reply_queue.pending_keys()
+    if not keys or time.monotonic() - _renewed_at < RENEW_INTERVAL:
+        return
+    held = {'_id': {'$in': keys}, 'status': 'sending', 'leased_by': WORKER_ID}
+    db.outbox().update_many(held, {'$set': {'lease_until': datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}})
+    renewed = {doc['_id'] for doc in db.outbox().find(held, {'_id': 1})}
+    for key in keys:
+        if key not in renewed:
+            print(f"Lease on {key} was lost to another worker. Not posting it here.")
+            reply_queue.discard(key)
+    _renewed_at = time.monotonic()
+
+def retry_backoff(failures):
+    """Return the delay before an item that failed failures times is claimed again."""
+    return timedelta(seconds=min(RETRY_BACKOFF * 2 ** (failures - 1), MAX_RETRY_BACKOFF))
+
+def record_results():
+    """Mark this drain's items as done, failed or due for a retry, and delete the reminders posted for, in bulk."""
+    if not _completed and not _failed:
+        return
+    now = datetime.utcnow()
+    operations = []
+    if _completed:
+        operations.append(UpdateMany(
+            {'_id': {'$in': [item['_id'] for item in _completed]}},
+            {'$set': {'status': 'done', 'completed_at': now}, '$unset': {'body': ''}}
+        ))
+    given_up = [item for item, permanent in _failed if permanent]
+    if given_up:
+        operations.append(UpdateMany(
+            {'_id': {'$in': [item['_id'] for item in given_up]}},
+            {'$set': {'status': 'failed', 'completed_at': now}}
+        ))
+    for item, permanent in _failed:
+        if not permanent:
+            failures = item.get('failures', 0) + 1
+            operations.append(UpdateOne(
+                {'_id': item['_id']},
+                {'$set': {'status': 'pending', 'lease_until': now + retry_backoff(failures), 'failures': failures},
+                 '$unset': {'leased_by': ''}}
+            ))
+    db.outbox().bulk_write(operations)
+    # Reminders whose parent comment is gone can never fire, so they are removed as well
+    reminder_ids = [item['reminder_id'] for item in _completed + given_up if item.get('reminder_id') is not None]
+    if reminder_ids:
+        db.reminders().delete_many({'_id': {'$in': reminder_ids}})
+    _completed.clear()
+    _failed.clear()
+
+def drain_once():
+    """Move claimed items into the reply queue and broadcast what the rate limiter allows."""
+    with _lock:
+        room = CLAIM_BATCH - reply_queue.pending_count()
+        for item in claim(room) if room > 0 else []:
+            reply_queue.queue_reply(
+                item['parent_author'], item['parent_permlink'], item['body'], key=item['_id'],
+                permlink=item.get('permlink'),  # Items queued by older versions derive theirs when posted
+                on_success=lambda item=item: complete(item),
+                on_failure=lambda permanent, item=item: fail(item, permanent)
+            )
+        try:
+            renew_leases()
+            reply_queue.flush()
+        finally:
+            record_results()
+        return reply_queue.next_flush_delay()
+
+def has_pending():
+    """Check whether any reply is waiting to be posted; items backing off after a failure don't count."""
+    claimable = {'status': {'$in': ['pending', 'sending']}, 'lease_until': {'$lte': datetime.utcnow()}}
+    return reply_queue.pending_count() > 0 or db.outbox().count_documents(claimable, limit=1) > 0
+
+def worker_loop():
+    """Posting worker: drain the outbox until stopped."""
+    while not _stop_event.is_set():
+        try:
+            delay = drain_once()
+        except Exception as e:
+            print(f"Posting worker error: {e}")
+            delay = None
+        _stop_event.wait(POLL_INTERVAL if delay is None else min(delay, POLL_INTERVAL))
+
+def start_workers(count=POSTING_WORKERS):
+    """Start the posting workers in the background."""
+    ensure_indexes()
+    _stop_event.clear()
+    for number in range(count):
+        worker = threading.Thread(target=worker_loop, name=f"posting-worker-{number}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+def stop_workers(timeout=reply_queue.DRAIN_TIMEOUT):
+    """Wait up to timeout seconds for the outbox to empty, then stop the workers.
+
+    Items still leased when the workers stop are picked up again after their
+    lease expires.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not has_pending():
+            break
+        time.sleep(POLL_INTERVAL)
+    else:
+        print("Stopping posting workers with replies still queued.")
+    _stop_event.set()
+    for worker in _workers:
+        worker.join()
+    _workers.clear()
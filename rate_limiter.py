@@ -0,0 +1,70 @@
+import time
+
+RC_REGEN_SECONDS = 5 * 24 * 60 * 60  # Resource credits regenerate fully in five days
+MIN_REPLY_INTERVAL = 3  # Seconds Hive requires between comment operations of one account
+RC_RESERVE = 0.05  # Share of the account's max RC left untouched
+
+class RateLimiter:
+    """Token bucket of resource credits combined with Hive's minimum comment interval.
+
+    Tokens are RC units. The bucket is synced from the account's RC manabar and
+    refills at the chain's regeneration rate in between syncs. The clock is
+    injectable so the limiter can be driven by a simulated clock.
+    """
+
+    def __init__(self, clock=time.monotonic, min_interval=MIN_REPLY_INTERVAL):
+        self.clock = clock
+        self.min_interval = min_interval
+        self.tokens = None  # Spendable RC; None until the first sync
+        self.capacity = None
+        self.rate = 0.0  # RC regenerated per second
+        self.cost_per_byte = None
+        self.updated = clock()
+        self.synced_at = None
+        self.last_broadcast = None
+
+    def sync(self, current_mana, max_mana, cost_per_byte):
+        """Reset the bucket from the account's RC manabar."""
+        now = self.clock()
+        reserve = max_mana * RC_RESERVE
+        self.capacity = max_mana - reserve
+        self.tokens = min(current_mana - reserve, self.capacity)
+        self.rate = max_mana / RC_REGEN_SECONDS
+        self.cost_per_byte = cost_per_byte
+        self.updated = now
+        self.synced_at = now
+
+    def needs_sync(self, max_age):
+        """Check whether the RC reading is missing or older than max_age seconds."""
+        return self.synced_at is None or self.clock() - self.synced_at >= max_age
+
+    def cost(self, size_bytes):
+        """Estimate the RC cost of broadcasting size_bytes of comment operations."""
+        return size_bytes * self.cost_per_byte if self.cost_per_byte else 0
+
+    def refill(self):
+        now = self.clock()
+        if self.tokens is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=0):
+        """Return the seconds until a broadcast costing cost RC would be allowed."""
+        self.refill()
+        wait = 0.0
+        if self.last_broadcast is not None:
+            wait = self.last_broadcast + self.min_interval - self.clock()
+        if self.tokens is not None and cost > self.tokens:
+            if cost > self.capacity or self.rate <= 0:
+                return float('inf')
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return max(wait, 0.0)
+
+    def try_acquire(self, cost=0):
+        """Take cost RC for a broadcast if allowed right now. Never blocks."""
+        if self.wait_time(cost) > 0:
+            return False
+        if self.tokens is not None:
+            self.tokens -= cost
+        self.last_broadcast = self.clock()
+        return True
@@ -1,151 +1,350 @@
 import os
+import math
 import time
+import zlib
+import heapq
+import itertools
+import threading
 import random
-from datetime import datetime, timedelta
-from dateutil import parser
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from pymongo import MongoClient, errors
-from beem import Hive
-from beem.comment import Comment
-from beem.exceptions import ContentDoesNotExistsException
+from pymongo import ASCENDING, ReturnDocument, UpdateOne, errors
+from templates import render, TemplateError
+import outbox
+import db
 
 # Load environment variables
 load_dotenv()
 
 HIVE_USER = os.getenv('HIVE_USERNAME')
-HIVE_POSTING_KEY = os.getenv('POSTING_KEY')
-MONGO_URI = os.getenv('MONGO_URI')
 DEFAULT_REMIND_NOTIFICATION = "Attention @{author}!! Here's your reminder to check back on this conversation!"
 DEFAULT_FOOTER = ""
+REMINDER_BATCH_SIZE = 100  # Due reminders claimed and marked queued per batch
+CLAIM_SECONDS = 120  # A claimed reminder is released to other workers if not queued by then
+REMINDER_SHARDS = int(os.getenv('REMINDER_SHARDS', '1'))  # Workers splitting reminders by author hash
+REMINDER_SHARD = int(os.getenv('REMINDER_SHARD', '0'))  # This worker's shard, 0 to REMINDER_SHARDS - 1
+WORKER_ID = outbox.WORKER_ID  # Recorded on the reminders this process claims
+REMINDER_BODY_CHARS = int(os.getenv('REMINDER_BODY_CHARS', '0'))  # Comment text kept with each reminder for templates
+# The only reminder fields firing needs; every read of due reminders is projected to these
+REMINDER_FIELDS = {'author': 1, 'permlink': 1, 'block_timestamp': 1, 'target_timestamp': 1, 'body': 1}
+UPCOMING_PREFETCH = 100  # Upcoming due times kept in the in-process heap
+SCHEDULER_RESYNC = 600  # Reload the heap from MongoDB at least this often (seconds)
+UNWATCHED_RESYNC = 30  # Reload interval while no change stream reports reminders added by other instances
+TEMPLATE_TTL = 600  # Reload the reply_text templates this often (seconds)
 
-# List of Hive API nodes
-HIVE_API_NODES = [
-    'https://api.hive.blog',
-    'https://api.deathwing.me',
-    'https://api.openhive.network'
-]
+# In-process scheduler state: a min-heap of upcoming due times
+_due_heap = []
+_heap_loaded_at = None
+_heap_lock = threading.Lock()  # The heap is also fed by the reminder watcher and comment worker threads
+_scheduler_ready = False
+_reminder_watcher = None
+_reminders_watching = False
 
-# Initialize MongoDB client
-client = MongoClient(MONGO_URI)
-db = client['reminder_bot']
-reminders_collection = db['reminders']
-reply_text_collection = db.get_collection('reply_text')
+# Reply templates grouped by type, loaded from 'reply_text'
+_templates = None
+_templates_loaded_at = None
 
-def get_random_text(type):
-    """Fetch a random text from the 'reply_text' collection based on the type."""
-    try:
-        documents = list(reply_text_collection.find({'type': type}))
-        if documents:
-            return random.choice(documents)['text']
-    except errors.PyMongoError as e:
-        print(f"Database error: {e}")
-    return None
-
-def initialize_hive_client(api_index=0):
-    """Initialize the Hive client with a specific API node."""
-    hive = Hive(keys=[HIVE_POSTING_KEY], node=HIVE_API_NODES[api_index % len(HIVE_API_NODES)])
-    return hive
+def load_templates():
+    """Load every reply_text document once and group the texts by type.
 
-def process_reminders():
-    """Process the reminders and reply to comments when their time is up."""
-    current_time = datetime.utcnow()
-    remaining_reminders = []
+    Each type maps to its texts and, if any document has a 'weight' field, the
+    cumulative weights used for weighted selection.
+    """
+    grouped = {}
+    for doc in db.reply_text().find({}, {'type': 1, 'text': 1, 'weight': 1}):
+        if 'type' in doc and doc.get('text'):
+            weight = doc.get('weight')
+            if weight is not None and not is_valid_weight(weight):
+                print(f"Ignoring invalid weight {weight!r} of reply_text {doc['_id']}")
+                weight = None
+            grouped.setdefault(doc['type'], []).append((doc['text'], weight))
+
+    templates = {}
+    for type, entries in grouped.items():
+        texts = [text for text, _ in entries]
+        cum_weights = None
+        if any(weight is not None for _, weight in entries):
+            # Documents without a weight count as weight 1
+            weights = [max(weight if weight is not None else 1, 0) for _, weight in entries]
+            if sum(weights) > 0:
+                cum_weights = list(itertools.accumulate(weights))
+        templates[type] = (texts, cum_weights)
+    return templates
 
-    # Fetch reminders from MongoDB
-    reminders = reminders_collection.find()
+def is_valid_weight(weight):
+    """Check that a reply_text weight is a finite number; bools and numeric strings are not."""
+    return isinstance(weight, (int, float)) and not isinstance(weight, bool) and math.isfinite(weight)
 
+def get_random_text(type):
+    """Pick a random text of the given type from the cached 'reply_text' templates."""
+    global _templates, _templates_loaded_at
+    if _templates is None or time.monotonic() - _templates_loaded_at >= TEMPLATE_TTL:
+        try:
+            _templates = load_templates()
+            _templates_loaded_at = time.monotonic()
+        except errors.PyMongoError as e:
+            print(f"Database error: {e}")
+            if _templates is None:
+                return None
+    texts, cum_weights = _templates.get(type, (None, None))
+    if not texts:
+        return None
+    if cum_weights is None:
+        return random.choice(texts)
+    return random.choices(texts, cum_weights=cum_weights)[0]
+
+def to_utc_naive(timestamp):
+    """Return the timestamp as a naive UTC datetime, as stored by MongoDB."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def normalize_target_timestamps():
+    """Convert string target_timestamps to BSON datetimes and drop unusable reminders."""
+    reminders = db.reminders().find(
+        {'target_timestamp': {'$not': {'$type': 'date'}}},
+        {'target_timestamp': 1, 'permlink': 1}
+    )
     for reminder in reminders:
         target_timestamp = reminder.get('target_timestamp')
-        
         if isinstance(target_timestamp, str):
             try:
                 target_timestamp = datetime.strptime(target_timestamp, '%Y-%m-%dT%H:%M:%S')
-            except ValueError:
-                # If the string cannot be parsed, delete the reminder
-                print(f"Invalid target_timestamp format for reminder: {reminder['permlink']}. Deleting it.")
-                reminders_collection.delete_one({'_id': reminder['_id']})
+                db.reminders().update_one({'_id': reminder['_id']}, {'$set': {'target_timestamp': target_timestamp}})
                 continue
-        
-        elif not isinstance(target_timestamp, datetime):
-            # If target_timestamp is neither a string nor a datetime, delete the reminder
-            print(f"Invalid target_timestamp type for reminder: {reminder['permlink']}. Deleting it.")
-            reminders_collection.delete_one({'_id': reminder['_id']})
-            continue
-        
-        if current_time >= target_timestamp:
-            print(f"Processing reminder: {reminder['author']}/{reminder['permlink']}")
-            reply_comment(reminder)
+            except ValueError:
+                print(f"Invalid target_timestamp format for reminder: {reminder.get('permlink')}. Deleting it.")
         else:
-            remaining_reminders.append(reminder)
+            print(f"Invalid target_timestamp type for reminder: {reminder.get('permlink')}. Deleting it.")
+        db.reminders().delete_one({'_id': reminder['_id']})
 
-def reply_comment(reminder, api_index=0, max_retries=3):
-    """Reply to the comment indicating the reminder is due, with retry logic on failure."""
-    attempts = 0
-    while attempts < max_retries:
-        try:
-            # Initialize Hive client
-            hive = initialize_hive_client(api_index)
-
-            # Create the comment object using author and permlink
-            authorperm = f"@{reminder['author']}/{reminder['permlink']}"
-            print(authorperm)
-            comment = Comment(authorperm, steem_instance=hive)
-
-            # Fetch random reminder notification and footer
-            remind_notification = get_random_text('remind_notification') or DEFAULT_REMIND_NOTIFICATION
-            print(remind_notification)
-            footer = get_random_text('footer') or DEFAULT_FOOTER
-
-            # Format the reply body
-            reply_body = f"{remind_notification}"           
-            if footer:
-                reply_body = f"{reply_body}\n\n----\n{footer}"
-                
-            try:
-                formatted_reply = eval(f"f'''{reply_body}'''")
-                reply_body = formatted_reply
-            except Exception as e:
-                print(f"Error formatting remind_notification: {e}")
+def compact_reminder(comment, target_timestamp):
+    """Return the stored form of a reminder: just what is needed to fire it."""
+    reminder = {
+        'author': comment['author'],
+        'permlink': comment['permlink'],
+        'block_timestamp': to_datetime(comment['block_timestamp']),
+        'target_timestamp': target_timestamp,
+        'shard_key': shard_key(comment['author'])
+    }
+    if REMINDER_BODY_CHARS > 0:
+        reminder['body'] = comment['body'][:REMINDER_BODY_CHARS]
+    return reminder
+
+def to_datetime(timestamp):
+    """Parse a block timestamp string; datetimes are returned unchanged."""
+    if isinstance(timestamp, str):
+        return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S')
+    return timestamp
+
+def shard_key(author):
+    """Return a stable hash of the author for splitting reminders between workers."""
+    return zlib.crc32(author.encode('utf-8'))
+
+def in_shard(author):
+    """Check whether this worker fires the author's reminders."""
+    return REMINDER_SHARDS <= 1 or shard_key(author) % REMINDER_SHARDS == REMINDER_SHARD
+
+def shard_filter():
+    """Restrict queries to this worker's shard when reminders are sharded."""
+    if REMINDER_SHARDS <= 1:
+        return {}
+    return {'shard_key': {'$mod': [REMINDER_SHARDS, REMINDER_SHARD]}}
+
+def backfill_shard_keys():
+    """Give reminders stored before sharding existed their shard_key."""
+    operations = [
+        UpdateOne({'_id': doc['_id']}, {'$set': {'shard_key': shard_key(doc['author'])}})
+        for doc in db.reminders().find({'shard_key': {'$exists': False}}, {'author': 1})
+    ]
+    if operations:
+        db.reminders().bulk_write(operations, ordered=False)
 
-            # Post the reply
-            comment.reply(reply_body, author=HIVE_USER)
-            print(f"Replied with comment: {reminder['permlink']}")
+def init_scheduler():
+    """Make sure the due-time index exists and stored timestamps are datetimes."""
+    global _scheduler_ready
+    if _scheduler_ready:
+        return
+    db.reminders().create_index([('target_timestamp', ASCENDING)])
+    normalize_target_timestamps()
+    if REMINDER_SHARDS > 1:
+        backfill_shard_keys()
+    start_reminder_watcher()
+    _scheduler_ready = True
 
-            # Remove the reminder from reminders
-            reminders_collection.delete_one({'_id': reminder['_id']})
+def start_reminder_watcher():
+    """Watch for reminders added by any instance in the background, once per process."""
+    global _reminder_watcher
+    if _reminder_watcher is None:
+        _reminder_watcher = threading.Thread(target=watch_reminders, name="reminder-watcher", daemon=True)
+        _reminder_watcher.start()
 
-            # Wait for 3 seconds to avoid overloading the blockchain with transactions
-            time.sleep(3)
+def watch_reminders():
+    """Schedule the reminders of this worker's shard inserted by any instance until the change stream closes.
 
-            # Exit the loop after a successful reply
+    Without it, reminders added by other instances would only be noticed at the
+    next heap reload.
+    """
+    global _reminders_watching
+    match = {'operationType': 'insert'}
+    match.update({f'fullDocument.{field}': condition for field, condition in shard_filter().items()})
+    try:
+        with db.reminders().watch([{'$match': match}]) as stream:
+            # Reload once the stream is open so no reminder inserted in between is missed
+            load_upcoming()
+            _reminders_watching = True
+            for change in stream:
+                reminder = change['fullDocument']
+                schedule_reminder(reminder['target_timestamp'], reminder['author'])
+    except Exception as e:
+        print(f"Reminder change stream unavailable, reloading due times every {UNWATCHED_RESYNC} seconds instead: {e}")
+    _reminders_watching = False
+
+def load_upcoming():
+    """Reload the heap with the earliest due times of reminders not yet handed to the outbox.
+
+    A reminder claimed by a worker can only be claimed here once the claim
+    expires, so it is scheduled for then instead of its target time.
+    """
+    global _due_heap, _heap_loaded_at
+    upcoming = db.reminders().find(
+        {'queued': {'$ne': True}, **shard_filter()},
+        {'target_timestamp': 1, 'claimed_until': 1, '_id': 0}
+    ).sort('target_timestamp', ASCENDING).limit(UPCOMING_PREFETCH)
+    due_times = [max(doc['target_timestamp'], doc.get('claimed_until') or doc['target_timestamp']) for doc in upcoming]
+    heapq.heapify(due_times)
+    with _heap_lock:
+        _due_heap = due_times
+        _heap_loaded_at = time.monotonic()
+
+def schedule_reminder(target_timestamp, author):
+    """Register the due time of a newly added reminder with the scheduler, if this worker fires it."""
+    if _heap_loaded_at is not None and in_shard(author):
+        with _heap_lock:
+            heapq.heappush(_due_heap, to_utc_naive(target_timestamp))
+
+def next_due_time():
+    """Return the earliest known upcoming due time, or None if nothing is scheduled."""
+    with _heap_lock:
+        return _due_heap[0] if _due_heap else None
+
+def nothing_due(current_time):
+    """Check the heap to see whether the MongoDB round-trip can be skipped."""
+    resync = SCHEDULER_RESYNC if _reminders_watching else UNWATCHED_RESYNC
+    if _heap_loaded_at is None or time.monotonic() - _heap_loaded_at >= resync:
+        return False
+    due = next_due_time()
+    return due is None or due > current_time
+
+def process_reminders():
+    """Process the reminders and reply to comments when their time is up."""
+    init_scheduler()
+    current_time = datetime.utcnow()
+    if nothing_due(current_time):
+        return
+
+    # Claim due reminders not yet handed to the outbox, oldest first, and queue their replies
+    while True:
+        reminders = claim_due_reminders(current_time, REMINDER_BATCH_SIZE)
+        keys = {}
+        for reminder in reminders:
+            print(f"Processing reminder: {reminder['author']}/{reminder['permlink']}")
+            keys[reminder['_id']] = reply_comment(reminder)
+        # A reminder whose reply was already posted or given up on would otherwise stay queued forever
+        finished = outbox.finished([key for key in keys.values() if key is not None])
+        delete_fired([reminder_id for reminder_id, key in keys.items() if key in finished])
+        mark_queued([reminder_id for reminder_id, key in keys.items() if key not in finished])
+        if len(reminders) < REMINDER_BATCH_SIZE:
+            break
+
+    load_upcoming()
+
+def claim_due_reminders(current_time, limit):
+    """Lease up to limit due reminders to this worker, including ones whose previous claim expired.
+
+    Each reminder is claimed with an atomic find_one_and_update, so concurrent
+    workers never claim the same one; a worker that dies releases its claims
+    when they expire after CLAIM_SECONDS.
+    """
+    claimed = []
+    while len(claimed) < limit:
+        reminder = db.reminders().find_one_and_update(
+            {
+                'target_timestamp': {'$lte': current_time},
+                'queued': {'$ne': True},
+                '$or': [{'claimed_until': {'$exists': False}}, {'claimed_until': {'$lte': datetime.utcnow()}}],
+                **shard_filter()
+            },
+            {'$set': {'claimed_until': datetime.utcnow() + timedelta(seconds=CLAIM_SECONDS), 'claimed_by': WORKER_ID}},
+            projection=REMINDER_FIELDS,
+            sort=[('target_timestamp', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if reminder is None:
             break
+        claimed.append(reminder)
+    return claimed
+
+def mark_queued(reminder_ids):
+    """Flag reminders whose replies are in the outbox with one update_many."""
+    if reminder_ids:
+        db.reminders().update_many(
+            {'_id': {'$in': reminder_ids}},
+            {'$set': {'queued': True}, '$unset': {'claimed_until': '', 'claimed_by': ''}}
+        )
 
-        except ContentDoesNotExistsException:
-            print(f"Failed to reply: The comment @{reminder['author']}/{reminder['permlink']} does not exist.")
-            break  # No need to retry if the comment does not exist
+def delete_fired(reminder_ids):
+    """Delete reminders whose replies the outbox already finished with."""
+    if reminder_ids:
+        print(f"Deleting {len(reminder_ids)} reminders that were already replied to")
+        db.reminders().delete_many({'_id': {'$in': reminder_ids}})
 
-        except Exception as e:
-            attempts += 1
-            print(f"An error occurred while trying to reply (Attempt {attempts}/{max_retries}): {e}")
-            if attempts >= max_retries:
-                print(f"Failed to reply after {max_retries} attempts.")
-            else:
-                time.sleep(2)  # Wait before retrying
+def reply_comment(reminder):
+    """Queue the reply indicating the reminder is due and return its outbox key; the reminder is deleted once it is posted.
+
+    The caller marks the reminder as queued once the outbox holds the reply.
+    """
+    authorperm = f"@{reminder['author']}/{reminder['permlink']}"
+    print(authorperm)
+    # Templates refer to the reminded comment as 'comment'
+    comment = reminder
+
+    # Fetch random reminder notification and footer
+    remind_notification = get_random_text('remind_notification') or DEFAULT_REMIND_NOTIFICATION
+    print(remind_notification)
+    footer = get_random_text('footer') or DEFAULT_FOOTER
+
+    # Format the reply body
+    reply_body = f"{remind_notification}"           
+    if footer:
+        reply_body = f"{reply_body}\n\n----\n{footer}"
+        
+    try:
+        reply_body = render(reply_body, {
+            'comment': comment,
+            'reminder': reminder,
+            'author': reminder['author'],
+            'block_timestamp': reminder.get('block_timestamp'),
+            'target_timestamp': reminder.get('target_timestamp'),
+            'HIVE_USER': HIVE_USER,
+            'time_ago': time_ago
+        })
+    except TemplateError as e:
+        print(f"Error formatting remind_notification: {e}")
 
-        if attempts >= max_retries and api_index < len(HIVE_API_NODES) - 1:
-            print("Falling back to next API node...")
-            reply_comment(reminder, api_index + 1, max_retries)
-        elif attempts >= max_retries:
-            print("Failed to reply with all API nodes.")
+    return outbox.enqueue('reminder', reminder['author'], reminder['permlink'], reply_body,
+                          reminder_id=reminder['_id'], due_at=reminder.get('target_timestamp'))
 
 def time_ago(past_time, current_time=None):
     """Return a human-readable 'x ago' string."""
     if isinstance(past_time, str):
+        from dateutil import parser  # Only string timestamps need dateutil
         past_time = parser.parse(past_time)
         
     if current_time is None:
         current_time = datetime.utcnow()  # Use current UTC time by default
     elif isinstance(current_time, str):
+        from dateutil import parser
         current_time = parser.parse(current_time)
 
     delta = current_time - past_time
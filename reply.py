@@ -1,57 +1,96 @@
 import os
-import time
 from datetime import datetime, timedelta
-from dateutil import parser
 from dotenv import load_dotenv
-from beem import Hive
-from beem.comment import Comment
-from beem.exceptions import ContentDoesNotExistsException
-from pymongo import MongoClient
-from reminder_handler import get_random_text, time_ago
+from pymongo import UpdateOne, ASCENDING, errors
+from reminder_handler import get_random_text, time_ago, schedule_reminder, compact_reminder
+from templates import render, TemplateError
+from listener import REMINDME_PATTERN
+import outbox
+import db
+import metrics
 import re
+from collections import Counter
+from functools import lru_cache
 
 # Load environment variables
 load_dotenv()
 HIVE_USER = os.getenv('HIVE_USERNAME')
-HIVE_POSTING_KEY = os.getenv('POSTING_KEY')
-MONGO_URI = os.getenv('MONGO_URI')
 
-# List of Hive API nodes
-HIVE_API_NODES = [
-    'https://api.hive.blog',
-    'https://api.deathwing.me',
-    'https://api.openhive.network'
-]
+# Writes buffered for the current block batch and sent by flush_writes()
+_pending_reminders = []  # (upsert operation, processed key, author, target timestamp) per accepted command
+_indexes_ready = False
+_dry_run = False  # Build writes but never send them (replays)
 
-# MongoDB client
-client = MongoClient(MONGO_URI)
-db = client['reminder_bot']
-upcoming_reminders = db['reminders']
-users_collection = db['list_of_users']
+# Time expression grammar, compiled once
+COMMAND_PATTERN = re.compile(r'!remindme\s*(.*)', re.IGNORECASE)
+AMOUNT = r'\d+(?:\.\d+)?|\d+:\d+'
+UNIT = r'(?:second|sec|minute|min|hour|hr|day|week|month|moon|year)s?'
+CLAUSE_PATTERN = re.compile(rf'({AMOUNT})\s*({UNIT})')
+DURATION_PATTERN = re.compile(rf'(?:in\s+)?(?:{AMOUNT})\s*{UNIT}(?:(?:\s*,\s*(?:and\s+)?|\s+and\s+)(?:{AMOUNT})\s*{UNIT})*')
+RELATIVE_PATTERN = re.compile(r'^(?:tomorrow|next\s+(\w+))(?:\s+at\s+(\d{1,2}):(\d{2}))?$')
+DATE_PATTERN = re.compile(r'\b(?:on|at)\s+(?:the\s+)?(?:(\w+),?\s+(\d{1,2})(?:st|nd|rd|th)?,?|(\d{1,2})(?:st|nd|rd|th)?,?(?:\s+(?:of\s+)?(\w+),?))?\s*(\d{4})?')
 
-def initialize_hive_client(api_index=0):
-    """Initialize the Hive client with a specific API node."""
-    hive = Hive(keys=[HIVE_POSTING_KEY], node=HIVE_API_NODES[api_index % len(HIVE_API_NODES)])
-    return hive
+# Length of one unit; months and years are approximated as 30 and 365 days
+UNIT_DELTAS = {
+    'second': timedelta(seconds=1),
+    'sec': timedelta(seconds=1),
+    'minute': timedelta(minutes=1),
+    'min': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'hr': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=30),
+    'moon': timedelta(days=30),
+    'year': timedelta(days=365)
+}
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']  # Matched on the first three letters of a day name
 
-def handle_new_comment(comment):
-    """Handle new comments, check for !RemindMe and reply if necessary."""
-    if "!remindme" in comment['body'].lower():
-        time_string = extract_time_string(comment['body'])
+def parse_comment(body, block_timestamp):
+    """Extract and parse the time expression of a comment.
+
+    Returns (time_string, target_timestamp), either of which may be None. This
+    only depends on its arguments, so it can run on a process pool.
+    """
+    time_string = extract_time_string(body)
+    if not time_string:
+        return None, None
+    return time_string, calculate_target_timestamp(block_timestamp, time_string)
+
+def handle_new_comment(comment, parse_pool=None):
+    """Handle new comments, check for !RemindMe and reply if necessary.
+
+    parse_pool is an optional executor, such as a process pool, to run the
+    parsing on.
+    """
+    # Matched case-insensitively on the raw body, like the listener's pre-filter, without lowercasing a copy
+    if REMINDME_PATTERN.search(comment['body']):
+        block_timestamp = comment['block_timestamp']
+        with metrics.span('parse_seconds'):
+            if parse_pool is None:
+                time_string, target_timestamp = parse_comment(comment['body'], block_timestamp)
+            else:
+                time_string, target_timestamp = parse_pool.submit(parse_comment, comment['body'], block_timestamp).result()
         if time_string:
-            block_timestamp = comment['block_timestamp']
-            target_timestamp = calculate_target_timestamp(block_timestamp, time_string)
+            metrics.increment('commands_total', parsed=bool(target_timestamp))
             if target_timestamp:
                 add_to_reminder_list(comment, target_timestamp)
                 reply_body = get_random_text("confirm_listing")
                 
                 try:
-                    formatted_reply = eval(f"f'''{reply_body}'''")
-                    reply_body = formatted_reply
-                except Exception as e:
-                    print(f"Error formatting remind_notification: {e}")
+                    reply_body = render(reply_body, {
+                        'comment': comment,
+                        'author': comment['author'],
+                        'time_string': time_string,
+                        'block_timestamp': block_timestamp,
+                        'target_timestamp': target_timestamp,
+                        'HIVE_USER': HIVE_USER,
+                        'time_ago': time_ago
+                    })
+                except TemplateError as e:
+                    print(f"Error formatting confirm_listing: {e}")
                 
-                reply_to_comment(initialize_hive_client(), comment, reply_body)
+                reply_to_comment(comment, reply_body)
             else:
                 reply_with_error(comment)
         else:
@@ -62,151 +101,90 @@ def handle_new_comment(comment):
 
 def extract_time_string(body):
     """Extract everything on the same line as '!remindme' as the time string."""
-    match = re.search(r'!remindme\s*(.*)', body, re.IGNORECASE)
+    match = COMMAND_PATTERN.search(body)
     if match:
         return match.group(1).strip()
     return None
 
+def parse_amount(amount):
+    """Parse an amount such as '2', '1.5' or '1:30' (one and a half units)."""
+    if ':' in amount:
+        whole, sixtieths = map(float, amount.split(':'))
+        return whole + sixtieths / 60
+    return float(amount)
+
+@lru_cache(maxsize=1024)
+def parse_duration(time_string):
+    """Parse "[in] X unit [and Y unit ...]" into a timedelta, or None if it does not match."""
+    match = DURATION_PATTERN.match(time_string)
+    if not match:
+        return None
+    delta = timedelta()
+    for amount, unit in CLAUSE_PATTERN.findall(match.group(0)):
+        delta += UNIT_DELTAS[unit.rstrip('s')] * parse_amount(amount)
+    return delta
+
+@lru_cache(maxsize=1024)
 def calculate_target_timestamp(block_timestamp, time_string):
-    """Calculate the target timestamp based on the provided time string."""
+    """Calculate the target timestamp based on the provided time string, or None if it cannot be parsed.
+
+    Every stage is anchored on the comment's block timestamp rather than the
+    current time, so reprocessing old blocks schedules the same reminders as
+    live processing did.
+    """
+    try:
+        return resolve_time_string(block_timestamp, time_string)
+    except (OverflowError, ValueError):
+        # Amounts such as "9000 years" reach past the dates datetime can represent
+        return None
+
+def resolve_time_string(block_timestamp, time_string):
+    """Run the parsing stages of calculate_target_timestamp; may raise for out-of-range dates."""
     time_string = time_string.lower().strip()
+    block_timestamp = datetime.strptime(block_timestamp, '%Y-%m-%dT%H:%M:%S')
         
-    # Stage 1: Manual parsing for "in {number} {unit}" pattern
-    match = re.match(
-        r'(?:in\s+)?(\d+(?:\.\d+)?|\d+:\d+)\s*(second[s]?|sec[s]?|minute[s]?|min[s]?|hour[s]?|hr[s]?|day[s]?|week[s]?|month[s]?|moon[s]?|year[s]?)(?:\s+and\s+(\d+(?:\.\d+)?|\d+:\d+)\s*(second[s]?|sec[s]?|minute[s]?|min[s]?|hour[s]?|hr[s]?|day[s]?|week[s]?|month[s]?|moon[s]?|year[s]?))?',
-        time_string
-    )
+    # Stage 1: Table-driven parsing for "in {number} {unit} [and {number} {unit} ...]"
+    delta = parse_duration(time_string)
     
+    if delta is not None:
+        return block_timestamp + delta
     
-    if match:
-        # First amount and unit
-        amount1, unit1 = match.group(1), match.group(2)
-        # Parse the first amount, handling fractional and time format (1:30 hours)
-        if ':' in amount1:
-            hours, minutes = map(float, amount1.split(':'))
-            amount1 = hours + minutes / 60
-        else:
-            amount1 = float(amount1)
-        
-        # Second amount and unit (if present)
-        amount2 = float(match.group(4)) if match.group(3) else 0
-        unit2 = match.group(4) if match.group(4) else None
-        
-        # Parse the second amount if provided
-        if unit2:
-            if ':' in amount2:
-                hours, minutes = map(float, amount2.split(':'))
-                amount2 = hours + minutes / 60
-            else:
-                amount2 = float(amount2)
-
-        # Time delta calculation based on units
-        delta = timedelta()
-        
-        # Calculate delta for the first unit
-        if 'second' in unit1 or 'sec' in unit1:
-            delta += timedelta(seconds=amount1)
-        elif 'minute' in unit1 or 'min' in unit1:
-            delta += timedelta(minutes=amount1)
-        elif 'hour' in unit1 or 'hr' in unit1:
-            delta += timedelta(hours=amount1)
-        elif 'day' in unit1:
-            delta += timedelta(days=amount1)
-        elif 'week' in unit1:
-            delta += timedelta(weeks=amount1)
-        elif 'month' in unit1 or 'moon' in unit1:
-            delta += timedelta(days=amount1 * 30)  # Approximate 1 month as 30 days
-        elif 'year' in unit1:
-            delta += timedelta(days=amount1 * 365)  # Approximate 1 year as 365 days
-        
-        # Repeat for the second unit if present
-        if unit2:
-            if 'second' in unit2 or 'sec' in unit2:
-                delta += timedelta(seconds=amount2)
-            elif 'minute' in unit2 or 'min' in unit2:
-                delta += timedelta(minutes=amount2)
-            elif 'hour' in unit2 or 'hr' in unit2:
-                delta += timedelta(hours=amount2)
-            elif 'day' in unit2:
-                delta += timedelta(days=amount2)
-            elif 'week' in unit2:
-                delta += timedelta(weeks=amount2)
-            elif 'month' in unit2 or 'moon' in unit2:
-                delta += timedelta(days=amount2 * 30)
-            elif 'year' in unit2:
-                delta += timedelta(days=amount2 * 365)
-        
-        # Convert block timestamp to datetime
-        block_timestamp = datetime.strptime(block_timestamp, '%Y-%m-%dT%H:%M:%S')
-        target_timestamp = block_timestamp + delta
-        return target_timestamp
-    
-    # Stage 1.5: Parsing for relative time expressions
-    # Stage 1.5: Parsing for relative time expressions
-    elif re.search(r'^(tomorrow|next\s+(?:\w+|(?:hour[s]?|day[s]?|week[s]?|month[s]?|year[s]?|(?:mon|tues|wed|thurs|fri|sat|sun)[a-z]*)))(?:\s+at\s+(\d{1,2}):(\d{2}))?$', time_string):
-        today = datetime.utcnow()
-        target_date = today
+    # Stage 1.5: Parsing for relative time expressions ("tomorrow", "next week", "next friday at 10:30")
+    relative_match = RELATIVE_PATTERN.match(time_string)
+    if relative_match:
+        word, hour, minute = relative_match.groups()
+        target_date = block_timestamp
 
-        if "tomorrow" in time_string:
+        if word is None:  # tomorrow
             target_date += timedelta(days=1)
-            
-        elif "next" in time_string:
-            # Handling time units like hour, day, week, month, and year
-            if any(unit in time_string for unit in ["hour", "day", "week", "month", "year"]):
-                if "hour" in time_string:
-                    target_date += timedelta(hours=1)
-                elif "day" in time_string:
-                    target_date += timedelta(days=1)
-                elif "week" in time_string:
-                    target_date += timedelta(weeks=1)
-                elif "month" in time_string:
-                    target_date += timedelta(days=30)  # Approximate 1 month as 30 days
-                elif "year" in time_string:
-                    target_date += timedelta(days=365)  # Approximate 1 year as 365 days
-            else:
-                # Handling day names including abbreviated forms
-                days_of_week = {
-                    'monday': 0, 'mon': 0,
-                    'tuesday': 1, 'tue': 1,
-                    'wednesday': 2, 'wed': 2,
-                    'thursday': 3, 'thu': 3,
-                    'friday': 4, 'fri': 4,
-                    'saturday': 5, 'sat': 5,
-                    'sunday': 6, 'sun': 6
-                }
-                for dayname in days_of_week:
-                    if dayname in time_string.lower():
-                        days_ahead = (days_of_week[dayname] - today.weekday() + 7) % 7
-                        if days_ahead == 0:  # If the day is today, get next week's day
-                            days_ahead = 7
-                        target_date += timedelta(days=days_ahead)
-                        break
-
-        # Optional "at X" handling
-        at_match = re.search(r'at\s+(\d{1,2}):(\d{2})', time_string)
-        
-        if at_match:
-           try:
-                hour = int(at_match.group(1))
-                minute = int(at_match.group(2))
+        elif word.rstrip('s') in UNIT_DELTAS:
+            target_date += UNIT_DELTAS[word.rstrip('s')]
+        elif word[:3] in WEEKDAYS:
+            # Day names including abbreviated forms; today's name means a week from now
+            days_ahead = (WEEKDAYS.index(word[:3]) - block_timestamp.weekday() + 7) % 7 or 7
+            target_date += timedelta(days=days_ahead)
+        else:
+            # "next weekend" and the like have no fixed length; ask for a clearer time instead
+            return None
 
-                # Validate hour and minute ranges
-                if 0 <= hour < 24 and 0 <= minute < 60:
-                    target_date = target_date.replace(hour=hour, minute=minute, second=0)
-                else:
-                    print(f"Invalid time specified: {hour}:{minute}")
-           except (ValueError, IndexError) as e:
-                print(f"Failed to parse time at clause: {e}")
+        # Optional "at HH:MM" handling
+        if hour is not None:
+            hour, minute = int(hour), int(minute)
+            # Validate hour and minute ranges
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                target_date = target_date.replace(hour=hour, minute=minute, second=0)
+            else:
+                print(f"Invalid time specified: {hour}:{minute}")
         
         # Return the target_date if found in Stage 1.5   
         return target_date
 
     
-    # Stage 2: Parsing with dateutil.parser
-    elif re.search(r'\b(?:on|at)\s+(?:the\s+)?(?:(\w+),?\s+(\d{1,2})(?:st|nd|rd|th)?,?|(\d{1,2})(?:st|nd|rd|th)?,?(?:\s+(?:of\s+)?(\w+),?))?\s*(\d{4})?', time_string):
+    # Stage 2: Parsing with dateutil.parser; missing fields default to the block's date
+    elif DATE_PATTERN.search(time_string):
+       from dateutil import parser  # Only this fallback needs dateutil
        try:
-          specific_date = parser.parse(time_string, fuzzy=True)
-          block_timestamp = datetime.strptime(block_timestamp, '%Y-%m-%dT%H:%M:%S')
+          specific_date = parser.parse(time_string, fuzzy=True, default=block_timestamp.replace(hour=0, minute=0, second=0))
           if specific_date.year == block_timestamp.year and specific_date.month < block_timestamp.month:
              specific_date = specific_date.replace(year=specific_date.year + 1)
           #if specific_date.hour == 0 and specific_date.minute == 0 and specific_date.second == 0:
@@ -219,56 +197,106 @@ def calculate_target_timestamp(block_timestamp, time_string):
     # Stage 3: Return None if unable to parse
     return None
 
-def add_to_reminder_list(comment, target_timestamp):
-    """Add the comment and target timestamp to the reminder list (MongoDB)."""
-    reminder_data = {
-        'author': comment['author'],
-        'permlink': comment['permlink'],
-        'parent_author': comment['parent_author'],
-        'parent_permlink': comment['parent_permlink'],
-        'body': comment['body'],
-        'block_timestamp': comment['block_timestamp'],
-        'target_timestamp': target_timestamp
-    }
-    upcoming_reminders.insert_one(reminder_data)
-    print(f"Added reminder for {comment['author']} at {target_timestamp}")
+def set_dry_run(enabled):
+    """Keep reminders and replies out of the database, e.g. while replaying blocks against a live database."""
+    global _dry_run
+    _dry_run = enabled
 
-def reply_to_comment(hive, comment, reply_body, increase_count=True):
-    """Reply to the comment and optionally update user's remindme count."""
+def ensure_indexes():
+    """Create the unique indexes that make reminder and user writes idempotent."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
     try:
-        if increase_count:
-            user = users_collection.find_one({'author': comment['author']})
-            if user:
-                users_collection.update_one({'author': comment['author']}, {'$inc': {'remindme_count': 1}})
-                print(f"Updated remindme_count for {comment['author']}")
-            else:
-                new_user = {'author': comment['author'], 'remindme_count': 1, 'premium': 0}
-                users_collection.insert_one(new_user)
-                print(f"Added new user: {comment['author']}")
+        db.reminders().create_index([('author', ASCENDING), ('permlink', ASCENDING)], unique=True)
+        db.users().create_index('author', unique=True)
+    except errors.OperationFailure as e:
+        print(f"Could not create unique indexes, duplicates may need cleaning up: {e}")
+    _indexes_ready = True
 
-        # Reply to the comment on Hive        
-        comment_obj = Comment(f"@{comment['author']}/{comment['permlink']}", steem_instance=hive)
-        reply = comment_obj.reply(body=reply_body, author=HIVE_USER)
-        print(f"Replied with comment: {comment['permlink']}")
-        time.sleep(3)
-        
-    except ContentDoesNotExistsException:
-        print(f"Failed to reply: The comment @{comment['author']}/{comment['permlink']} does not exist.")
-    except Exception as e:
-        print(f"An error occurred while replying: {e}")
+def processed_key(author, permlink):
+    """Return the _id of the processed record of author/permlink."""
+    return f"{author}/{permlink}"
+
+def add_to_reminder_list(comment, target_timestamp):
+    """Buffer the comment and target timestamp for the reminder list (MongoDB)."""
+    operation = UpdateOne(
+        {'author': comment['author'], 'permlink': comment['permlink']},
+        {'$setOnInsert': compact_reminder(comment, target_timestamp)},
+        upsert=True
+    )
+    key = processed_key(comment['author'], comment['permlink'])
+    _pending_reminders.append((operation, key, comment['author'], target_timestamp))
+    print(f"Added reminder for {comment['author']} at {target_timestamp}")
 
-def reply_with_error(comment, api_index=0):
-    """Reply with an error message if time parsing fails, with fallback API nodes."""
-    hive = initialize_hive_client(api_index)
+def reply_to_comment(comment, reply_body, kind='confirm'):
+    """Queue a reply to the comment; replies already queued for it are not queued again."""
+    if _dry_run:
+        return
+    # Hand the reply to the posting workers through the durable outbox
+    outbox.enqueue(kind, comment['author'], comment['permlink'], reply_body)
+
+def reply_with_error(comment):
+    """Reply with an error message if time parsing fails."""
     reply_body = get_random_text("parsing_error")
-    
+    reply_to_comment(comment, reply_body, kind='error')
+
+def bulk_upsert(collection, operations):
+    """Send upserts in one unordered bulk_write and return the indexes of the ones that inserted.
+
+    Duplicate keys from concurrent upserts of the same document are ignored.
+    """
     try:
-        reply_to_comment(hive, comment, reply_body, increase_count=False)
-    except Exception as e:
-        print(f"Error replying with {HIVE_API_NODES[api_index % len(HIVE_API_NODES)]}: {e}")
-        if api_index < len(HIVE_API_NODES) - 1:
-            print("Falling back to next API node...")
-            reply_with_error(comment, api_index + 1)
-        else:
-            print("Failed to reply with all API nodes.")
+        result = collection.bulk_write(operations, ordered=False)
+        return set(result.upserted_ids)
+    except errors.BulkWriteError as e:
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+        return {upsert['index'] for upsert in e.details['upserted']}
+
+def flush_writes():
+    """Write the reminders buffered for this block batch and count the new ones towards their authors.
+
+    A comment's reminder is only ever added once: comments that already have a
+    processed record (edited comments, blocks processed again after a restart)
+    are skipped even after their reminder fired and was deleted. The processed
+    records are written last, so a crash before them only repeats idempotent upserts.
+    """
+    if not _pending_reminders:
+        return
+    if _dry_run:
+        discard_writes()
+        return
+    ensure_indexes()
+    keys = list({key for _, key, _, _ in _pending_reminders})
+    seen = {record['_id'] for record in db.processed().find({'_id': {'$in': keys}}, {'_id': 1})}
+    fresh = [entry for entry in _pending_reminders if entry[1] not in seen]
+    inserted = bulk_upsert(db.reminders(), [operation for operation, _, _, _ in fresh]) if fresh else set()
+    counts = Counter()
+    for index, (_, _, author, target_timestamp) in enumerate(fresh):
+        if index in inserted:
+            counts[author] += 1
+            schedule_reminder(target_timestamp, author)
+    if counts:
+        bulk_upsert(db.users(), [
+            UpdateOne(
+                {'author': author},
+                {'$inc': {'remindme_count': count}, '$setOnInsert': {'premium': 0}},
+                upsert=True
+            )
+            for author, count in counts.items()
+        ])
+        print(f"Updated remindme_count for {len(counts)} users")
+    if fresh:
+        now = datetime.utcnow()
+        bulk_upsert(db.processed(), [
+            UpdateOne({'_id': key}, {'$setOnInsert': {'processed_at': now}}, upsert=True)
+            for key in {key for _, key, _, _ in fresh}
+        ])
+    if len(fresh) < len(_pending_reminders):
+        print(f"Skipped {len(_pending_reminders) - len(fresh)} reminders that were already processed")
+    discard_writes()
 
+def discard_writes():
+    """Drop buffered writes, e.g. when a block batch failed and will be processed again."""
+    _pending_reminders.clear()
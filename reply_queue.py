@@ -0,0 +1,201 @@
+import os
+from dotenv import load_dotenv
+from rate_limiter import RateLimiter
+import metrics
+from hive_client import get_hive_client, reset_hive_client
+
+# Load environment variables
+load_dotenv()
+HIVE_USER = os.getenv('HIVE_USERNAME')
+
+# Every reply is a comment by HIVE_USER, and the chain enforces the 3-second interval per comment
+# operation, so each reply is broadcast in a transaction of its own
+MAX_PERMLINK_LENGTH = 256  # HIVE_MAX_PERMLINK_LENGTH
+OP_OVERHEAD_BYTES = 200  # Serialized size of a comment operation besides body and permlinks
+RC_SAMPLE_BYTES = 1000  # Operation size the RC cost estimate is taken for
+RC_SYNC_INTERVAL = 300  # Seconds between reads of the account's RC manabar
+MAX_ATTEMPTS = 3  # Broadcast attempts per reply before it is dropped
+RETRY_DELAY = 2  # Seconds before a failed reply is retried, doubled per attempt
+DRAIN_TIMEOUT = 120  # Seconds a one-shot run waits for queued replies before exiting
+# Chain rejections that no retry can fix: the parent comment is gone or does not accept replies
+PERMANENT_ERRORS = ("doesn't exist", "does not exist", "disabled replies", "maximum depth")
+
+# Replies waiting to be broadcast, in the order they were queued
+_pending = []
+_pending_keys = set()
+_api_index = 0  # Offset into the node ranking, advanced after a failed broadcast
+
+# All posting goes through one limiter so replies run at the highest safe rate
+limiter = RateLimiter()
+
+def queue_reply(parent_author, parent_permlink, body, key=None, on_success=None, on_failure=None, permlink=None):
+    """Queue a reply for the next flush. Replies with a key already pending are ignored.
+
+    permlink is the reply's own permlink; by default it is derived from the parent.
+    """
+    if key is not None and key in _pending_keys:
+        return False
+    _pending.append({
+        'key': key,
+        'parent_author': parent_author,
+        'parent_permlink': parent_permlink,
+        'permlink': permlink,
+        'body': body,
+        'on_success': on_success,
+        'on_failure': on_failure,
+        'attempts': 0,
+        'next_attempt': 0.0,  # Limiter clock time before which the reply is not retried
+        'permanent': False  # Set when the chain rejected the reply for good
+    })
+    if key is not None:
+        _pending_keys.add(key)
+    return True
+
+def is_queued(key):
+    """Check whether a reply with this key is waiting to be broadcast."""
+    return key in _pending_keys
+
+def pending_count():
+    """Return the number of replies waiting to be broadcast."""
+    return len(_pending)
+
+def pending_keys():
+    """Return the keys of the replies waiting to be broadcast."""
+    return list(_pending_keys)
+
+def discard(key):
+    """Remove a queued reply without calling its callbacks, e.g. after another worker took it over."""
+    global _pending
+    _pending = [item for item in _pending if item['key'] != key]
+    _pending_keys.discard(key)
+
+def reply_permlink(kind, parent_author, parent_permlink):
+    """Return the permlink of the kind of reply to a comment.
+
+    It does not depend on the time of the broadcast, so posting a reply again
+    after a timeout or crash edits the reply instead of adding a second one.
+    """
+    # beem is slow to import, so it is only loaded once a reply is actually queued
+    from beem.utils import derive_permlink
+    prefix = f"{kind}-" if kind else ""
+    return prefix + derive_permlink("", parent_permlink, parent_author,
+                                    max_permlink_length=MAX_PERMLINK_LENGTH - len(prefix), with_suffix=False)
+
+def build_operation(item):
+    """Build the comment operation for a queued reply."""
+    from beembase import operations
+    return operations.Comment(**{
+        'parent_author': item['parent_author'],
+        'parent_permlink': item['parent_permlink'],
+        'author': HIVE_USER,
+        'permlink': item['permlink'] or reply_permlink(None, item['parent_author'], item['parent_permlink']),
+        'title': "",
+        'body': item['body'],
+        'json_metadata': {}
+    })
+
+def estimate_size(item):
+    """Approximate the serialized size of a queued reply's operation in bytes."""
+    return (len(item['body'].encode('utf-8')) + len(item['parent_author'])
+            + 2 * len(item['parent_permlink']) + OP_OVERHEAD_BYTES)
+
+def sync_resource_credits(hive):
+    """Refresh the rate limiter from the account's RC manabar and the current comment cost."""
+    from beem.account import Account
+    from beem.rc import RC
+    try:
+        manabar = Account(HIVE_USER, blockchain_instance=hive).get_rc_manabar()
+        cost_per_byte = RC(blockchain_instance=hive).comment(tx_size=RC_SAMPLE_BYTES) / RC_SAMPLE_BYTES
+        limiter.sync(manabar['current_mana'], manabar['max_mana'], cost_per_byte)
+    except Exception as e:
+        print(f"Could not read resource credits for {HIVE_USER}: {e}")
+
+def due_replies(now):
+    """Return the queued replies that are due for an attempt, oldest first."""
+    return [item for item in _pending if item['next_attempt'] <= now]
+
+def broadcast_reply(hive, item):
+    """Sign and broadcast a transaction holding the reply's comment operation."""
+    from beem.transactionbuilder import TransactionBuilder
+    tx = TransactionBuilder(blockchain_instance=hive)
+    tx.appendOps([build_operation(item)])
+    tx.appendSigner(HIVE_USER, 'posting')
+    tx.sign()
+    tx.broadcast()
+
+def record_failure(item, error, now):
+    """Schedule a failed reply for retry with exponential backoff."""
+    permanent = is_permanent_error(error)
+    item['attempts'] = MAX_ATTEMPTS if permanent else item['attempts'] + 1
+    item['next_attempt'] = now + RETRY_DELAY * 2 ** (item['attempts'] - 1)
+    item['permanent'] = permanent
+    print(f"Failed to reply to @{item['parent_author']}/{item['parent_permlink']} (Attempt {item['attempts']}/{MAX_ATTEMPTS}): {error}")
+
+def is_permanent_error(error):
+    """Check whether the chain rejected a reply for a reason retrying cannot fix."""
+    if is_connection_error(error):
+        return False
+    message = str(error).lower()
+    return any(phrase in message for phrase in PERMANENT_ERRORS)
+
+def is_connection_error(error):
+    """Check whether a broadcast failed on the way to the node rather than being rejected by the chain."""
+    from beemapi.exceptions import NumRetriesReached, RPCConnection, TimeoutException, WorkingNodeMissing
+    # requests' connection and timeout errors are OSErrors
+    return isinstance(error, (OSError, NumRetriesReached, RPCConnection, TimeoutException, WorkingNodeMissing))
+
+def flush():
+    """Broadcast as many queued replies as the rate limiter allows right now. Never sleeps.
+
+    Each reply is its own transaction; what cannot be sent yet stays queued
+    for the next flush.
+    """
+    global _pending, _api_index
+    if not _pending:
+        return
+    hive = get_hive_client(_api_index)
+    if limiter.needs_sync(RC_SYNC_INTERVAL):
+        sync_resource_credits(hive)
+
+    confirmed = []
+    now = limiter.clock()
+    for item in due_replies(now):
+        if not limiter.try_acquire(limiter.cost(estimate_size(item))):
+            break  # Rate limited; the rest waits for a later flush
+        try:
+            with metrics.span('reply_broadcast_seconds'):
+                broadcast_reply(hive, item)
+            print(f"Replied to @{item['parent_author']}/{item['parent_permlink']}")
+            metrics.increment('replies_posted_total')
+            confirmed.append(item)
+        except Exception as e:
+            metrics.increment('broadcast_errors_total')
+            record_failure(item, e, now)
+            if is_connection_error(e):
+                # Retry later through the next healthiest node
+                reset_hive_client(hive)
+                _api_index += 1
+                break
+            # The chain rejected this reply (e.g. a deleted parent); the node is fine
+
+    for item in confirmed:
+        if item['on_success'] is not None:
+            item['on_success']()
+
+    done = {id(item) for item in confirmed}
+    dropped = [item for item in _pending if id(item) not in done and item['attempts'] >= MAX_ATTEMPTS]
+    for item in dropped:
+        print(f"Giving up on reply to @{item['parent_author']}/{item['parent_permlink']} after {MAX_ATTEMPTS} attempts.")
+        metrics.increment('replies_dropped_total')
+        if item['on_failure'] is not None:
+            item['on_failure'](item['permanent'])
+    _pending = [item for item in _pending if id(item) not in done and item['attempts'] < MAX_ATTEMPTS]
+    for item in confirmed + dropped:
+        _pending_keys.discard(item['key'])
+
+def next_flush_delay():
+    """Return the seconds until the next queued reply could be broadcast, or None if none is queued."""
+    if not _pending:
+        return None
+    retry_wait = min(item['next_attempt'] for item in _pending) - limiter.clock()
+    return max(limiter.wait_time(), retry_wait, 0.0)
@@ -0,0 +1,136 @@
+import ast
+import re
+from functools import lru_cache
+
+# Names a reply template may refer to; anything else is rejected when the template is compiled
+ALLOWED_NAMES = {
+    'comment', 'reminder', 'author', 'time_string', 'block_timestamp',
+    'target_timestamp', 'HIVE_USER', 'time_ago'
+}
+ALLOWED_CALLS = {'time_ago'}
+CONVERSIONS = {'s': str, 'r': repr, 'a': ascii}
+ESCAPES = {'n': '\n', 't': '\t', '\\': '\\', "'": "'", '"': '"'}
+ESCAPE_PATTERN = re.compile(r'\\([nt\\\'"])')
+
+class TemplateError(Exception):
+    """Raised for templates that cannot be compiled or rendered safely."""
+
+def unescape(literal):
+    """Apply the backslash escapes the old f-string formatting honoured in template text."""
+    return ESCAPE_PATTERN.sub(lambda match: ESCAPES[match.group(1)], literal)
+
+def compile_expression(node):
+    """Turn a whitelisted expression AST into a function of the render context."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float)):
+        value = node.value
+        return lambda context: value
+    if isinstance(node, ast.Name):
+        if node.id not in ALLOWED_NAMES:
+            raise TemplateError(f"Name '{node.id}' is not allowed in templates")
+        name = node.id
+        def lookup(context):
+            if name not in context:
+                raise TemplateError(f"'{name}' is not available in this template")
+            return context[name]
+        return lookup
+    if isinstance(node, ast.Subscript):
+        if not (isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, (str, int))):
+            raise TemplateError("Only constant keys can be used in templates")
+        base = compile_expression(node.value)
+        key = node.slice.value
+        return lambda context: base(context)[key]
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in ALLOWED_CALLS:
+            raise TemplateError("Only time_ago(...) can be called in templates")
+        function = compile_expression(node.func)
+        args = [compile_expression(arg) for arg in node.args]
+        kwargs = {keyword.arg: compile_expression(keyword.value) for keyword in node.keywords if keyword.arg}
+        if len(kwargs) != len(node.keywords):
+            raise TemplateError("Argument unpacking is not allowed in templates")
+        return lambda context: function(context)(
+            *[arg(context) for arg in args],
+            **{name: value(context) for name, value in kwargs.items()}
+        )
+    raise TemplateError(f"Unsupported expression in template: {type(node).__name__}")
+
+def split_field(field):
+    """Split a replacement field into its expression, conversion and format spec."""
+    depth, quote = 0, None
+    for index, char in enumerate(field):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif depth == 0 and char in '!:':
+            expression, rest = field[:index], field[index:]
+            conversion, format_spec = None, ''
+            if rest.startswith('!'):
+                conversion, rest = rest[1:2], rest[2:]
+                if conversion not in CONVERSIONS or (rest and not rest.startswith(':')):
+                    raise TemplateError(f"Invalid conversion in template field: {field}")
+            if rest.startswith(':'):
+                format_spec = rest[1:]
+            return expression, conversion, format_spec
+    return field, None, ''
+
+@lru_cache(maxsize=256)
+def compile_template(text):
+    """Parse a template once into literal text and compiled replacement fields."""
+    parts = []
+    literal = []
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char in '{}' and text[index:index + 2] in ('{{', '}}'):
+            literal.append(char)
+            index += 2
+            continue
+        if char == '}':
+            raise TemplateError("Single '}' in template")
+        if char != '{':
+            literal.append(char)
+            index += 1
+            continue
+
+        end = text.find('}', index)
+        if end == -1:
+            raise TemplateError("Unclosed '{' in template")
+        expression, conversion, format_spec = split_field(text[index + 1:end])
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise TemplateError(f"Invalid template field '{expression}': {e.msg}")
+        if literal:
+            parts.append(unescape(''.join(literal)))
+            literal = []
+        parts.append((compile_expression(tree.body), CONVERSIONS.get(conversion), format_spec))
+        index = end + 1
+    if literal:
+        parts.append(unescape(''.join(literal)))
+    return tuple(parts)
+
+def render(text, context):
+    """Render a reply template with only the whitelisted variables in context."""
+    if not text:
+        return text
+    output = []
+    for part in compile_template(text):
+        if isinstance(part, str):
+            output.append(part)
+            continue
+        evaluate, convert, format_spec = part
+        try:
+            value = evaluate(context)
+            if convert is not None:
+                value = convert(value)
+            output.append(format(value, format_spec))
+        except TemplateError:
+            raise
+        except Exception as e:
+            raise TemplateError(f"Failed to render template field: {e}")
+    return ''.join(output)
@@ -0,0 +1,71 @@
+import os
+import sys
+import mongomock
+import mongomock.collection
+import pytest
+
+# The bot is a set of top-level modules; make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import reminder_handler
+import reply_queue
+from rate_limiter import RateLimiter
+
+# pymongo passes sort= to bulk update builders; mongomock's do not accept it yet
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = (
+    lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+)
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """Point the shared MongoClient at a fresh in-memory database."""
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(db, '_client', client)
+    # Scheduler state is per process; start every test from scratch
+    monkeypatch.setattr(reminder_handler, '_due_heap', [])
+    monkeypatch.setattr(reminder_handler, '_heap_loaded_at', None)
+    monkeypatch.setattr(reminder_handler, '_scheduler_ready', False)
+    monkeypatch.setattr(reminder_handler, '_templates', None)
+    # mongomock has no change streams
+    monkeypatch.setattr(reminder_handler, 'start_reminder_watcher', lambda: None)
+    return client
+
+class SimulatedClock:
+    """A clock that only moves when the test advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return SimulatedClock()
+
+@pytest.fixture
+def posting(clock, monkeypatch):
+    """Post through reply_queue on the simulated clock, with a fake broadcast that raises whatever error is set.
+
+    Returns the state shared with the fake: the error to raise, and the keys and
+    permlinks of the replies broadcast.
+    """
+    monkeypatch.setattr(reply_queue, 'limiter', RateLimiter(clock=clock))
+    monkeypatch.setattr(reply_queue, '_pending', [])
+    monkeypatch.setattr(reply_queue, '_pending_keys', set())
+    monkeypatch.setattr(reply_queue, 'get_hive_client', lambda api_index=0: None)
+    monkeypatch.setattr(reply_queue, 'reset_hive_client', lambda hive: None)
+    monkeypatch.setattr(reply_queue, 'sync_resource_credits', lambda hive: None)
+    state = {'error': None, 'posted': [], 'permlinks': []}
+    def broadcast(hive, item):
+        state['permlinks'].append(item['permlink'])
+        if state['error'] is not None:
+            raise state['error']
+        state['posted'].append(item['key'])
+    monkeypatch.setattr(reply_queue, 'broadcast_reply', broadcast)
+    return state
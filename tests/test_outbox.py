@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import pytest
+import db
+import outbox
+import reply_queue
+
+@pytest.fixture(autouse=True)
+def fresh_outbox(mongo, monkeypatch):
+    monkeypatch.setattr(outbox, '_indexes_ready', False)
+    monkeypatch.setattr(outbox, '_renewed_at', float('-inf'))
+
+def drain_until_given_up(clock):
+    """Drain until reply_queue has used up its attempts on every claimed reply."""
+    for _ in range(reply_queue.MAX_ATTEMPTS + 1):
+        outbox.drain_once()
+        clock.advance(60)
+
+def queue_reminder_reply():
+    reminder_id = db.reminders().insert_one({'author': 'alice', 'permlink': 're-post', 'queued': True}).inserted_id
+    return outbox.enqueue('reminder', 'alice', 're-post', 'Reminder!', reminder_id=reminder_id)
+
+def test_posted_reminder_is_deleted(posting):
+    key = queue_reminder_reply()
+    outbox.drain_once()
+    assert posting['posted'] == [key]
+    assert db.outbox().find_one({'_id': key})['status'] == 'done'
+    assert db.reminders().count_documents({}) == 0
+
+def test_transient_failure_is_retried_later(posting, clock):
+    key = queue_reminder_reply()
+    posting['error'] = OSError("connection reset")
+    drain_until_given_up(clock)
+    item = db.outbox().find_one({'_id': key})
+    assert item['status'] == 'pending'
+    assert item['failures'] == 1
+    assert item['lease_until'] > datetime.utcnow() + timedelta(seconds=outbox.RETRY_BACKOFF - 10)
+    assert db.reminders().count_documents({}) == 1
+    # Backing-off items don't keep a one-shot run waiting
+    assert not outbox.has_pending()
+
+    posting['error'] = None
+    db.outbox().update_one({'_id': key}, {'$set': {'lease_until': datetime.utcnow()}})
+    outbox.drain_once()
+    assert posting['posted'] == [key]
+    assert db.reminders().count_documents({}) == 0
+
+def test_permanent_failure_gives_up_and_drops_the_reminder(posting):
+    key = queue_reminder_reply()
+    posting['error'] = Exception("Assert Exception: Parent comment doesn't exist")
+    outbox.drain_once()
+    assert db.outbox().find_one({'_id': key})['status'] == 'failed'
+    assert db.reminders().count_documents({}) == 0
+
+def test_lost_lease_is_not_posted(posting):
+    key = outbox.enqueue('confirm', 'bob', 're-post', 'Noted!')
+    reply_queue.limiter.last_broadcast = float('inf')  # Rate limited: the reply waits in reply_queue
+    reply_queue.limiter.min_interval = 1
+    outbox.drain_once()
+    assert reply_queue.is_queued(key)
+
+    # Another instance took the item over after the lease expired
+    db.outbox().update_one({'_id': key}, {'$set': {'leased_by': 'other-worker'}})
+    outbox._renewed_at = float('-inf')
+    outbox.drain_once()
+    assert not reply_queue.is_queued(key)
+
+def test_waiting_reply_keeps_its_lease(posting):
+    key = outbox.enqueue('confirm', 'bob', 're-post', 'Noted!')
+    reply_queue.limiter.last_broadcast = float('inf')
+    reply_queue.limiter.min_interval = 1
+    outbox.drain_once()
+    db.outbox().update_one({'_id': key}, {'$set': {'lease_until': datetime.utcnow()}})
+    outbox._renewed_at = float('-inf')
+    outbox.drain_once()
+    assert reply_queue.is_queued(key)
+    assert db.outbox().find_one({'_id': key})['lease_until'] > datetime.utcnow() + timedelta(seconds=outbox.LEASE_SECONDS - 10)
+
+def test_retries_reuse_the_reply_permlink(posting, clock):
+    key = outbox.enqueue('reminder', 'alice', 're-post', 'Reminder!')
+    permlink = db.outbox().find_one({'_id': key})['permlink']
+    assert permlink == 'reminder-re-alice-re-post'
+    assert permlink != reply_queue.reply_permlink('confirm', 'alice', 're-post')
+
+    # The broadcast timed out, possibly after the node accepted the reply
+    posting['error'] = OSError("read timed out")
+    drain_until_given_up(clock)
+    posting['error'] = None
+    db.outbox().update_one({'_id': key}, {'$set': {'lease_until': datetime.utcnow()}})
+    outbox.drain_once()
+    assert posting['posted'] == [key]
+    assert set(posting['permlinks']) == {permlink}
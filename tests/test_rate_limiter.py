@@ -0,0 +1,52 @@
+import pytest
+import reply_queue
+from rate_limiter import RateLimiter, MIN_REPLY_INTERVAL, RC_REGEN_SECONDS, RC_RESERVE
+
+def run_for(limiter, clock, seconds, cost, step=0.5):
+    """Try to post as often as the limiter allows for seconds of simulated time; return the posts made."""
+    posts = 0
+    end = clock() + seconds
+    while clock() < end:
+        if limiter.try_acquire(cost):
+            posts += 1
+        clock.advance(step)
+    return posts
+
+def test_plentiful_rc_runs_at_the_comment_interval(clock):
+    limiter = RateLimiter(clock=clock)
+    limiter.sync(current_mana=10 ** 12, max_mana=10 ** 12, cost_per_byte=1)
+    posts = run_for(limiter, clock, 600, cost=1000)
+    # One reply per MIN_REPLY_INTERVAL, not the old 20 per minute of sleep(3) plus broadcast time
+    assert posts == pytest.approx(600 / MIN_REPLY_INTERVAL, abs=1)
+
+def test_scarce_rc_runs_at_the_regeneration_rate(clock):
+    limiter = RateLimiter(clock=clock)
+    max_mana = 10 ** 9
+    limiter.sync(current_mana=max_mana * RC_RESERVE, max_mana=max_mana, cost_per_byte=1)  # Nothing spendable
+    cost = max_mana / RC_REGEN_SECONDS * 60  # One minute of regeneration per reply
+    posts = run_for(limiter, clock, 3600, cost=cost, step=1)
+    assert posts == pytest.approx(60, abs=1)
+
+def test_never_blocks_and_reports_the_wait(clock):
+    limiter = RateLimiter(clock=clock)
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert limiter.wait_time() == pytest.approx(MIN_REPLY_INTERVAL)
+    clock.advance(MIN_REPLY_INTERVAL)
+    assert limiter.try_acquire()
+
+def test_unaffordable_reply_waits_forever(clock):
+    limiter = RateLimiter(clock=clock)
+    limiter.sync(current_mana=100, max_mana=100, cost_per_byte=1)
+    assert limiter.wait_time(cost=1000) == float('inf')
+
+def test_reply_queue_posts_one_reply_per_interval(posting, clock):
+
+    for number in range(10):
+        reply_queue.queue_reply('alice', f're-post-{number}', 'Reminder!', key=number)
+    while reply_queue.pending_count():
+        reply_queue.flush()
+        clock.advance(reply_queue.next_flush_delay() or 0)
+    # Replies go out in order, spaced by the comment interval
+    assert posting['posted'] == list(range(10))
+    assert clock() == pytest.approx(9 * MIN_REPLY_INTERVAL)
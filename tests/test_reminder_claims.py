@@ -0,0 +1,122 @@
+import os
+import threading
+import multiprocessing
+from collections import Counter
+from datetime import datetime, timedelta
+import pytest
+import db
+import reminder_handler
+
+MONGO_TEST_URI = os.getenv('MONGO_TEST_URI')  # A disposable mongod for the multi-process test
+TEST_DATABASE = 'reminder_bot_test'
+REMINDERS = 500
+MOCK_REMINDERS = 150  # mongomock scans every document per claim
+WORKERS = 8
+
+def add_due_reminders(count):
+    due = datetime.utcnow() - timedelta(minutes=1)
+    db.reminders().insert_many([
+        {'author': f'user{number}', 'permlink': f're-post-{number}', 'target_timestamp': due - timedelta(seconds=number)}
+        for number in range(count)
+    ])
+
+def fire_due_reminders(batch_size):
+    """Claim due reminders until none are left and return the ids this worker claimed."""
+    claimed = []
+    while True:
+        reminders = reminder_handler.claim_due_reminders(datetime.utcnow(), batch_size)
+        if not reminders:
+            return claimed
+        claimed.extend(reminder['_id'] for reminder in reminders)
+        reminder_handler.mark_queued([reminder['_id'] for reminder in reminders])
+
+class AtomicCollection:
+    """Serializes calls to a mongomock collection, which, unlike mongod, does not apply each one atomically."""
+
+    def __init__(self, collection, lock):
+        self.collection = collection
+        self.lock = lock
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+        def locked(*args, **kwargs):
+            with self.lock:
+                return method(*args, **kwargs)
+        return locked
+
+def test_concurrent_workers_claim_each_reminder_once(mongo, monkeypatch):
+    add_due_reminders(MOCK_REMINDERS)
+    reminders = AtomicCollection(db.reminders(), threading.Lock())
+    monkeypatch.setattr(db, 'reminders', lambda: reminders)
+
+    results = [None] * WORKERS
+    start = threading.Barrier(WORKERS)
+    def worker(number):
+        start.wait()
+        results[number] = fire_due_reminders(batch_size=5)
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claims = Counter(reminder_id for claimed in results for reminder_id in claimed)
+    assert len(claims) == MOCK_REMINDERS
+    assert set(claims.values()) == {1}
+    assert db.reminders().count_documents({'queued': True}) == MOCK_REMINDERS
+
+def test_live_claims_are_skipped(mongo):
+    add_due_reminders(3)
+    db.reminders().update_many({}, {'$set': {'claimed_until': datetime.utcnow() + timedelta(minutes=1), 'claimed_by': 'other'}})
+    assert reminder_handler.claim_due_reminders(datetime.utcnow(), 10) == []
+
+def test_dead_workers_claims_expire(mongo):
+    add_due_reminders(3)
+    # A worker claimed the reminders and died before queueing their replies
+    db.reminders().update_many({}, {'$set': {'claimed_until': datetime.utcnow() - timedelta(seconds=1), 'claimed_by': 'dead'}})
+    assert len(fire_due_reminders(batch_size=10)) == 3
+    assert db.reminders().count_documents({'claimed_until': {'$exists': True}}) == 0
+
+def test_process_reminders_queues_each_reply_once(mongo, monkeypatch):
+    add_due_reminders(20)
+    enqueued = []
+    monkeypatch.setattr(reminder_handler.outbox, 'enqueue', lambda kind, author, permlink, *args, **kwargs: enqueued.append(permlink))
+    reminder_handler.process_reminders()
+    reminder_handler.process_reminders()
+    assert sorted(enqueued) == sorted(f're-post-{number}' for number in range(20))
+
+def test_shards_partition_authors(monkeypatch):
+    monkeypatch.setattr(reminder_handler, 'REMINDER_SHARDS', 3)
+    owners = Counter()
+    for shard in range(3):
+        monkeypatch.setattr(reminder_handler, 'REMINDER_SHARD', shard)
+        owners.update(author for author in (f'user{number}' for number in range(300)) if reminder_handler.in_shard(author))
+    assert len(owners) == 300
+    assert set(owners.values()) == {1}
+
+def fire_in_process(uri, number):
+    """Worker process for the mongod test: fire due reminders and return the ids claimed."""
+    db.MONGO_URI = uri
+    db.DATABASE_NAME = TEST_DATABASE
+    reminder_handler.WORKER_ID = f'test-worker-{number}'
+    try:
+        return fire_due_reminders(batch_size=5)
+    finally:
+        db.close()
+
+@pytest.mark.skipif(not MONGO_TEST_URI, reason="set MONGO_TEST_URI to a disposable mongod to run")
+def test_worker_processes_never_double_fire(monkeypatch):
+    monkeypatch.setattr(db, 'MONGO_URI', MONGO_TEST_URI)
+    monkeypatch.setattr(db, 'DATABASE_NAME', TEST_DATABASE)
+    monkeypatch.setattr(db, '_client', None)
+    db.get_client().drop_database(TEST_DATABASE)
+    try:
+        add_due_reminders(REMINDERS)
+        with multiprocessing.get_context('spawn').Pool(WORKERS) as pool:
+            results = pool.starmap(fire_in_process, [(MONGO_TEST_URI, number) for number in range(WORKERS)])
+        claims = Counter(reminder_id for claimed in results for reminder_id in claimed)
+        assert len(claims) == REMINDERS
+        assert set(claims.values()) == {1}
+    finally:
+        db.get_client().drop_database(TEST_DATABASE)
+        db.close()
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+import db
+import outbox
+import reply
+import reminder_handler
+
+COMMENT = {
+    'author': 'alice', 'permlink': 're-post', 'parent_author': 'bob', 'parent_permlink': 'post',
+    'body': '!remindme 2 days', 'block_timestamp': '2024-03-15T10:20:30'
+}
+
+def handle(comment):
+    reply.handle_new_comment(dict(comment))
+    reply.flush_writes()
+
+def remindme_count(author):
+    return db.users().find_one({'author': author})['remindme_count']
+
+def test_fired_reminder_is_not_added_again(mongo, monkeypatch):
+    monkeypatch.setattr(reply, '_indexes_ready', False)
+    db.reply_text().insert_one({'type': 'confirm_listing', 'text': "Noted, @{author}!"})
+    handle(COMMENT)
+    assert db.reminders().count_documents({}) == 1
+    assert remindme_count('alice') == 1
+
+    # The reminder fires and is deleted; then the comment is edited, or its block processed again
+    db.reminders().delete_many({})
+    handle(COMMENT)
+    handle({**COMMENT, 'body': '!remindme 3 days'})
+    assert db.reminders().count_documents({}) == 0
+    assert remindme_count('alice') == 1
+
+def test_reminder_already_replied_to_is_deleted(mongo):
+    db.reminders().insert_one({
+        'author': 'alice', 'permlink': 're-post', 'target_timestamp': datetime.utcnow() - timedelta(minutes=1)
+    })
+    db.outbox().insert_one({'_id': outbox.reply_key('reminder', 'alice', 're-post'), 'status': 'done'})
+    reminder_handler.process_reminders()
+    assert db.reminders().count_documents({}) == 0
@@ -0,0 +1,13 @@
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLOW_IMPORTS = ['beem', 'beemapi', 'beembase', 'dateutil']
+
+def test_importing_main_skips_slow_dependencies():
+    # A fresh interpreter: this one has imported whatever earlier tests needed
+    script = f"import sys, main; print(__import__('json').dumps([m for m in {SLOW_IMPORTS!r} if m in sys.modules]))"
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
@@ -0,0 +1,81 @@
+from datetime import datetime
+import pytest
+from templates import render, compile_template, TemplateError
+from reminder_handler import time_ago, load_templates
+import db
+
+CONTEXT = {
+    'comment': {'author': 'alice', 'permlink': 're-post', 'body': '!remindme 2 days'},
+    'author': 'alice',
+    'time_string': '2 days',
+    'block_timestamp': '2024-01-01T00:00:00',
+    'target_timestamp': datetime(2024, 1, 3),
+    'HIVE_USER': 'reminder.bot',
+    'time_ago': time_ago
+}
+
+def test_renders_whitelisted_fields():
+    text = "Hi @{author}, I'll ping you in {time_string} ({comment['permlink']!r}) on {target_timestamp:%Y-%m-%d}."
+    assert render(text, CONTEXT) == "Hi @alice, I'll ping you in 2 days ('re-post') on 2024-01-03."
+
+def test_renders_time_ago_and_escapes():
+    rendered = render("{{literal}}\\n{time_ago(block_timestamp, current_time='2024-01-03T00:00:00')}", CONTEXT)
+    assert rendered == "{literal}\n2 days ago"
+
+def test_compiles_each_template_once():
+    text = "Hello @{author}"
+    assert compile_template(text) is compile_template(text)
+
+@pytest.mark.parametrize('template', [
+    "{__import__('os').system('echo pwned')}",
+    "{open('/etc/passwd').read()}",
+    "{eval('1 + 1')}",
+    "{exec('import os')}",
+    "{globals()}",
+    "{comment.__class__}",
+    "{author.__class__.__mro__}",
+    "{time_ago.__globals__}",
+    "{time_ago.__code__}",
+    "{().__class__.__bases__}",
+    "{[c for c in ()]}",
+    "{(lambda: 1)()}",
+    "{author.upper()}",
+    "{time_ago(*comment)}",
+    "{time_ago(**comment)}",
+    "{comment[author]}",
+    "{os}",
+    "{author + author}",
+])
+def test_rejects_injection_attempts(template):
+    with pytest.raises(TemplateError):
+        render(template, CONTEXT)
+
+@pytest.mark.parametrize('template', [
+    "{author!x}",
+    "{author:>{HIVE_USER}}",
+    "{comment['missing']}",
+    "{reminder}",
+    "{author",
+    "author}",
+    "{author)}",
+])
+def test_rejects_malformed_or_unavailable_fields(template):
+    with pytest.raises(TemplateError):
+        render(template, CONTEXT)
+
+def test_database_text_is_not_executed(tmp_path):
+    marker = tmp_path / 'marker'
+    with pytest.raises(TemplateError):
+        render(f"{{__import__('pathlib').Path('{marker}').touch()}}", CONTEXT)
+    assert not marker.exists()
+
+def test_invalid_weights_count_as_one(mongo):
+    db.reply_text().insert_many([
+        {'type': 'footer', 'text': 'a', 'weight': '2'},
+        {'type': 'footer', 'text': 'b', 'weight': True},
+        {'type': 'footer', 'text': 'c', 'weight': float('nan')},
+        {'type': 'footer', 'text': 'd', 'weight': 3},
+    ])
+    texts, cum_weights = load_templates()['footer']
+    assert texts == ['a', 'b', 'c', 'd']
+    assert cum_weights == [1, 2, 3, 6]
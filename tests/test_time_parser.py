@@ -0,0 +1,75 @@
+from datetime import datetime
+import pytest
+import db
+import reply
+
+BLOCK_TIMESTAMP = '2024-03-15T10:20:30'  # A Friday
+
+# Command lines as users write them, with the reminder time they should produce
+CORPUS = [
+    ("!remindme 2 days", datetime(2024, 3, 17, 10, 20, 30)),
+    ("!RemindMe in 3 hours", datetime(2024, 3, 15, 13, 20, 30)),
+    ("!remindme 1 week", datetime(2024, 3, 22, 10, 20, 30)),
+    ("!remindme 30 minutes", datetime(2024, 3, 15, 10, 50, 30)),
+    ("!remindme 45 mins", datetime(2024, 3, 15, 11, 5, 30)),
+    ("!remindme 10 sec", datetime(2024, 3, 15, 10, 20, 40)),
+    ("!remindme 1 month", datetime(2024, 4, 14, 10, 20, 30)),
+    ("!remindme 1 moon", datetime(2024, 4, 14, 10, 20, 30)),
+    ("!remindme 1 year", datetime(2025, 3, 15, 10, 20, 30)),
+    ("!remindme 1.5 hours", datetime(2024, 3, 15, 11, 50, 30)),
+    ("!remindme 1:30 hours", datetime(2024, 3, 15, 11, 50, 30)),
+    ("!remindme 2 days and 3 hours", datetime(2024, 3, 17, 13, 20, 30)),
+    ("!remindme 1 week, 2 days and 4 hours", datetime(2024, 3, 24, 14, 20, 30)),
+    ("!remindme 1 hr, and 30 min", datetime(2024, 3, 15, 11, 50, 30)),
+    ("!remindme in 5 days please", datetime(2024, 3, 20, 10, 20, 30)),
+    ("Great post! !remindme 3 days\nThanks for sharing", datetime(2024, 3, 18, 10, 20, 30)),
+    ("!remindme tomorrow", datetime(2024, 3, 16, 10, 20, 30)),
+    ("!remindme tomorrow at 09:15", datetime(2024, 3, 16, 9, 15)),
+    ("!remindme next week", datetime(2024, 3, 22, 10, 20, 30)),
+    ("!remindme next month", datetime(2024, 4, 14, 10, 20, 30)),
+    ("!remindme next friday", datetime(2024, 3, 22, 10, 20, 30)),
+    ("!remindme next mon at 08:00", datetime(2024, 3, 18, 8, 0)),
+    ("!remindme next tuesday", datetime(2024, 3, 19, 10, 20, 30)),
+    ("!remindme on March 20", datetime(2024, 3, 20)),
+    ("!remindme on the 1st of April", datetime(2024, 4, 1)),
+    ("!remindme on January 5, 2025", datetime(2025, 1, 5)),
+]
+
+# Lines that must get the parse-error reply rather than a reminder
+UNPARSEABLE = [
+    "!remindme whenever",
+    "!remindme next weekend",
+    "!remindme next banana",
+    "!remindme 9000 years",
+    "!remindme 99999999999 days",
+    "!remindme " + "9" * 400 + " days",
+]
+
+@pytest.mark.parametrize('body, expected', CORPUS)
+def test_corpus(body, expected):
+    _, target = reply.parse_comment(body, BLOCK_TIMESTAMP)
+    assert target == expected
+
+@pytest.mark.parametrize('body', UNPARSEABLE)
+def test_unparseable(body):
+    time_string, target = reply.parse_comment(body, BLOCK_TIMESTAMP)
+    assert time_string
+    assert target is None
+
+def test_missing_time_string():
+    assert reply.parse_comment("!remindme", BLOCK_TIMESTAMP) == (None, None)
+
+def test_anchored_on_block_timestamp():
+    # Replaying an old block must schedule the same reminder as live processing did
+    assert reply.calculate_target_timestamp('2020-01-01T00:00:00', '2 days') == datetime(2020, 1, 3)
+
+def test_out_of_range_comment_gets_error_reply(mongo):
+    db.reply_text().insert_one({'type': 'parsing_error', 'text': "Sorry, I couldn't read that."})
+    comment = {
+        'author': 'alice', 'permlink': 're-post', 'parent_author': 'bob', 'parent_permlink': 'post',
+        'body': '!remindme 9000 years', 'block_timestamp': BLOCK_TIMESTAMP
+    }
+    reply.handle_new_comment(comment)
+    reply.flush_writes()
+    assert db.reminders().count_documents({}) == 0
+    assert db.outbox().find_one({}, {'kind': 1})['kind'] == 'error'